@@ -1,14 +1,22 @@
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
 import ast
 import json
-from typing import List
+import os
+from typing import List, Literal, Optional
+from backend import validation
+from backend.metrics import observe, stage
 
 app = FastAPI(title="TestGenie - Unit Test Generator")
 
 
+ValidationMode = Optional[Literal["compile", "collect", "run"]]
+
+
 class SourcePayload(BaseModel):
     source: str
+    validation: ValidationMode = None
 
 
 def _choose_sample_value(param_name: str) -> str:
@@ -24,12 +32,19 @@ def _choose_sample_value(param_name: str) -> str:
 
 def generate_tests_from_source(source: str) -> dict:
     try:
-        tree = ast.parse(source)
+        with stage("generate", "parse"):
+            tree = ast.parse(source)
     except SyntaxError as e:
         raise ValueError(f"Failed to parse source: {e}")
 
-    func_defs: List[ast.FunctionDef] = [n for n in tree.body if isinstance(n, ast.FunctionDef)]
+    with stage("generate", "symbols"):
+        func_defs: List[ast.FunctionDef] = [n for n in tree.body if isinstance(n, ast.FunctionDef)]
+
+    with stage("generate", "render"):
+        return _render_tests(source, func_defs)
 
+
+def _render_tests(source: str, func_defs: List[ast.FunctionDef]) -> dict:
     tests = []
     for fn in func_defs:
         name = fn.name
@@ -65,11 +80,31 @@ def generate_tests_from_source(source: str) -> dict:
 
 @app.post("/generate")
 async def generate(payload: SourcePayload):
+    require_validation_mode(payload.validation)
     try:
         result = generate_tests_from_source(payload.source)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
-    return result
+    if payload.validation:
+        result["validation"] = await validate_generated(result, payload.validation, "generate")
+    with stage("generate", "serialize"):
+        return JSONResponse(result)
+
+
+def require_validation_mode(mode: Optional[str]) -> None:
+    # collect and run import and execute the generated file, which embeds the
+    # client's source, so they are opt-in for the operator.
+    if mode and mode not in validation.ENABLED_MODES:
+        raise HTTPException(
+            status_code=403,
+            detail=f"Validation mode '{mode}' is disabled on this server. Enabled: {sorted(validation.ENABLED_MODES)}"
+        )
+
+
+async def validate_generated(result: dict, mode: str, operation: str, modules: Optional[dict] = None) -> dict:
+    """Compile, collect or run a generated pytest file (see backend/validation.py)."""
+    with stage(operation, "validate"):
+        return await validation.validate_test_file(result["content"], result["filename"], mode, modules)
 
 
 @app.get("/health")
@@ -79,68 +114,211 @@ async def health():
 
 # ── NEW: Tree-sitter + OpenAI endpoint (for VS Code extension) ────────────────
 
-from tree_sitter import Language, Parser
-import tree_sitter_python as tspython
-import tree_sitter_javascript as tsjavascript
-import tree_sitter_java as tsjava
-from openai import OpenAI
-from typing import Optional
-
-AI_LANGUAGES = {
-    "python": {
-        "language": Language(tspython.language()),
-        "test_framework": "pytest",
-        "framework_hints": "Prefix all test functions with test_. Use pytest.raises() for exceptions.",
-        "test_file_suffix": "_test",
-        "test_file_extension": ".py",
-    },
-    "javascript": {
-        "language": Language(tsjavascript.language()),
-        "test_framework": "Jest",
-        "framework_hints": "Use describe() and it() blocks. Use expect() matchers.",
-        "test_file_suffix": "",
-        "test_file_extension": ".test.js",
-    },
-    "java": {
-        "language": Language(tsjava.language()),
-        "test_framework": "JUnit 5",
-        "framework_hints": "Use @Test annotation. Use Assertions.assertEquals() and assertThrows().",
-        "test_file_suffix": "Test",
-        "test_file_extension": ".java",
-    },
-}
+from tree_sitter import Parser, Query, QueryCursor
+from typing import Dict, Optional
+from collections import OrderedDict
+from contextlib import contextmanager
+import asyncio
+import hashlib
+import itertools
+import queue
+import re
+import textwrap
+import time
+import uuid
+from backend import languages, llm
+from backend.cache import BlockCache, block_key
+from backend.slicing import CLASS_NODE_TYPES, FUNCTION_NODE_TYPES, ModuleSlicer, batch_context, pack_batches
 
-FUNCTION_NODE_TYPES = {
-    "function_definition", "function_declaration",
-    "method_declaration", "method_definition",
-}
-CLASS_NODE_TYPES = {
-    "class_definition", "class_declaration",
-}
+# Grammars are loaded on first use; see backend/languages.py for plugins.
+AI_LANGUAGES = languages.registry
 
-def extract_symbols_ai(source: str, language_id: str) -> list:
-    lang_config = AI_LANGUAGES[language_id]
-    parser = Parser(lang_config["language"])
-    tree = parser.parse(bytes(source, "utf-8"))
+_parser_pools: Dict[str, "queue.SimpleQueue"] = {}
+_symbol_queries: Dict[str, Query] = {}
+
+
+@contextmanager
+def pooled_parser(language_id: str):
+    pool = _parser_pools.setdefault(language_id, queue.SimpleQueue())
+    try:
+        parser = pool.get_nowait()
+    except queue.Empty:
+        parser = Parser(AI_LANGUAGES[language_id]["language"])
+    try:
+        yield parser
+    finally:
+        pool.put(parser)
+
+
+def parse_source_ai(source, language_id: str, old_tree=None):
+    data = source if isinstance(source, bytes) else bytes(source, "utf-8")
+    with pooled_parser(language_id) as parser:
+        if old_tree is None:
+            return parser.parse(data)
+        return parser.parse(data, old_tree=old_tree)
+
+
+def _symbol_query(language_id: str) -> Query:
+    query = _symbol_queries.get(language_id)
+    if query is None:
+        language = AI_LANGUAGES[language_id]["language"]
+        kinds = [k for k in sorted(FUNCTION_NODE_TYPES | CLASS_NODE_TYPES) if language.id_for_node_kind(k, True)]
+        query = Query(language, "[" + " ".join(f"({k})" for k in kinds) + "] @symbol")
+        _symbol_queries[language_id] = query
+    return query
+
+
+def _symbols_in_node(node, language_id: str, with_source: bool = True) -> list:
+    # The query walks the tree in C, so deep trees never hit Python's
+    # recursion limit.
+    nodes = QueryCursor(_symbol_query(language_id)).captures(node).get("symbol", [])
+    nodes.sort(key=lambda n: n.start_byte)
 
     symbols = []
+    for node in nodes:
+        name_node = node.child_by_field_name("name")
+        if not name_node:
+            continue
+        symbol = {
+            "type": "class" if node.type in CLASS_NODE_TYPES else "function",
+            "name": name_node.text.decode("utf-8"),
+        }
+        if with_source:
+            outer = node.parent if node.parent is not None and node.parent.type == "decorated_definition" else node
+            symbol["source"] = outer.text.decode("utf-8")
+        symbols.append(symbol)
+    return symbols
+
+
+def _dedupe_symbols(symbols) -> list:
+    unique = []
     seen = set()
+    for symbol in symbols:
+        key = (symbol["type"], symbol["name"])
+        if key not in seen:
+            seen.add(key)
+            unique.append(symbol)
+    return unique
 
-    def walk(node):
-        if node.type in FUNCTION_NODE_TYPES or node.type in CLASS_NODE_TYPES:
-            name_node = node.child_by_field_name("name")
-            if name_node:
-                name = name_node.text.decode("utf-8")
-                symbol_type = "class" if node.type in CLASS_NODE_TYPES else "function"
-                key = f"{symbol_type}:{name}"
-                if key not in seen:
-                    seen.add(key)
-                    symbols.append({"type": symbol_type, "name": name})
-        for child in node.children:
-            walk(child)
-
-    walk(tree.root_node)
-    return symbols
+
+def symbols_from_tree(tree, language_id: str, with_source: bool = True) -> list:
+    return _dedupe_symbols(_symbols_in_node(tree.root_node, language_id, with_source))
+
+
+def extract_symbols_ai(source: str, language_id: str) -> list:
+    return symbols_from_tree(parse_source_ai(source, language_id), language_id)
+
+
+def preload(language_ids=None) -> None:
+    """Load grammars and their queries and import the OpenAI client now.
+
+    Call before forking workers (e.g. ``gunicorn --preload``) so they share
+    these pages copy-on-write instead of each loading them on first use.
+    """
+    language_ids = list(language_ids or AI_LANGUAGES)
+    AI_LANGUAGES.preload(language_ids)
+    for language_id in language_ids:
+        _symbol_query(language_id)
+    llm.preload()
+
+
+if languages.PRELOAD:
+    preload(None if languages.PRELOAD == "all" else languages.PRELOAD.split(","))
+
+
+AI_SYSTEM_PROMPT = "You write clean, correct unit tests. Never use markdown fences."
+
+AI_FILE_PROMPT = """Generate a complete {test_framework} test file for the following {language} code.
+
+{symbol_section}
+
+Instructions: {framework_hints}
+Include all imports. Output ONLY raw code, no markdown fences.
+
+Source code:
+{source}"""
+
+AI_BATCH_PROMPT = """Write {test_framework} tests for these {language} symbols from the module `{module}`: {names}.
+
+Instructions: {framework_hints} {block_hints}
+Start the tests for each symbol with a line containing exactly `{marker} <symbol name>`, in the order listed, and put the imports those tests need right after it. Include the symbol's name in the name of every test and helper you write, so names never clash between symbols. Output ONLY raw code, no markdown fences.
+
+Context from the module (for reference, do not test it):
+{context}
+
+Symbols to test:
+{sources}"""
+
+AI_MODEL = llm.DEFAULT_MODEL
+AI_TEMPERATURE = 0.2
+# Batches of one request run at most this many at a time, so a huge file
+# does not flood the shared upstream wait queue on its own.
+AI_BATCH_PARALLELISM = int(os.getenv("TESTGENIE_BATCH_PARALLELISM", "16"))
+AI_TEMPLATE_VERSION = hashlib.sha256((AI_SYSTEM_PROMPT + AI_BATCH_PROMPT).encode("utf-8")).hexdigest()[:16]
+
+block_cache = BlockCache()
+
+
+def _strip_fences(text: str) -> str:
+    return text.replace("```python", "").replace("```javascript", "").replace("```java", "").replace("```", "").strip()
+
+
+def _split_imports(block: str, language_id: str):
+    pattern = AI_LANGUAGES[language_id]["import_pattern"]
+    lines = block.splitlines()
+    imports = []
+    depth = 0
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        if depth > 0:
+            imports[-1] += "\n" + line
+        elif re.match(pattern, line):
+            imports.append(line)
+        elif line.strip():
+            break
+        depth += line.count("(") + line.count("{") - line.count(")") - line.count("}")
+        depth = max(depth, 0)
+        i += 1
+    return imports, "\n".join(lines[i:]).strip()
+
+
+def _rename_clashes(body: str, patterns: List[str], defined: set) -> str:
+    """Rename names ``body`` defines at its top level that an earlier block already defined."""
+    names = {m.group(1) for pattern in patterns for m in re.finditer(pattern, body, re.M)}
+    for name in sorted(names & defined):
+        n = 2
+        while f"{name}_{n}" in defined or f"{name}_{n}" in names:
+            n += 1
+        body = re.sub(rf"\b{re.escape(name)}\b", f"{name}_{n}", body)
+        names.add(f"{name}_{n}")
+    defined |= names
+    return body
+
+
+def assemble_test_file(blocks: List[str], language_id: str, class_name: str) -> str:
+    # Blocks come from separate upstream calls or the cache, so two of them
+    # may define the same test (or Java field) name; later ones are renamed.
+    patterns = AI_LANGUAGES[language_id].get("definition_patterns", [])
+    defined = set()
+    imports = []
+    bodies = []
+    for block in blocks:
+        block_imports, body = _split_imports(block, language_id)
+        for imp in block_imports:
+            if imp not in imports:
+                imports.append(imp)
+        if body:
+            bodies.append(_rename_clashes(textwrap.dedent(body), patterns, defined))
+    imports.sort(key=lambda imp: not imp.startswith("package "))
+
+    header = "\n".join(imports)
+    if language_id == "java":
+        indented = [textwrap.indent(b, "    ") for b in bodies]
+        body = f"class {class_name} {{\n\n" + "\n\n".join(indented) + "\n}"
+    else:
+        body = "\n\n\n".join(bodies)
+    return f"{header}\n\n\n{body}\n" if header else f"{body}\n"
 
 
 class AIGenerateRequest(BaseModel):
@@ -148,6 +326,7 @@ class AIGenerateRequest(BaseModel):
     language: str = "python"
     filename: Optional[str] = "source"
     api_key: Optional[str] = None
+    validation: ValidationMode = None
 
 class AIGenerateResponse(BaseModel):
     filename: str
@@ -156,10 +335,36 @@ class AIGenerateResponse(BaseModel):
     classes_found: List[str]
     language: str
     test_framework: str
+    cache_hits: int = 0
+    cache_misses: int = 0
+    validation: Optional[dict] = None
 
 
-@app.post("/generate/ai", response_model=AIGenerateResponse)
-async def generate_ai(payload: AIGenerateRequest):
+async def _complete_or_http_error(prompt: str, api_key: str) -> str:
+    try:
+        with stage("generate_ai", "upstream"):
+            generated = await llm.complete(
+                [
+                    {"role": "system", "content": AI_SYSTEM_PROMPT},
+                    {"role": "user", "content": prompt}
+                ],
+                api_key=api_key,
+                model=AI_MODEL,
+                temperature=AI_TEMPERATURE,
+            )
+    except llm.LLMBusyError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"OpenAI error: {e}")
+    with stage("generate_ai", "fence_strip"):
+        return _strip_fences(generated)
+
+
+def _plan_ai_generation(payload: AIGenerateRequest) -> dict:
+    """Validate the request, parse it and work out which blocks must go upstream.
+
+    Parses, slices and reads the block cache, so callers run it in a thread.
+    """
     if payload.language not in AI_LANGUAGES:
         raise HTTPException(
             status_code=400,
@@ -167,9 +372,15 @@ async def generate_ai(payload: AIGenerateRequest):
         )
 
     lang_config = AI_LANGUAGES[payload.language]
+    require_validation_mode(payload.validation)
 
     try:
-        symbols = extract_symbols_ai(payload.source, payload.language)
+        with stage("generate_ai", "parse"):
+            tree = parse_source_ai(payload.source, payload.language)
+        with stage("generate_ai", "symbols"):
+            symbols = symbols_from_tree(tree, payload.language)
+        with stage("generate_ai", "slice"):
+            units = ModuleSlicer(tree, payload.language, lang_config["language"]).slice()
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Failed to parse source: {e}")
 
@@ -180,46 +391,132 @@ async def generate_ai(payload: AIGenerateRequest):
             detail="OpenAI API key not provided."
         )
 
-    functions = "\n".join(f"  - {s['name']}" for s in symbols if s["type"] == "function")
-    classes   = "\n".join(f"  - {s['name']}" for s in symbols if s["type"] == "class")
-    symbol_section = ""
-    if functions:
-        symbol_section += f"Functions to test:\n{functions}\n"
-    if classes:
-        symbol_section += f"Classes to test:\n{classes}\n"
-    if not symbol_section:
-        symbol_section = "(infer from source code)"
+    # Each unit (a top-level symbol, or a method of an oversized class) is
+    # cached on its own with only the context it references, so an edit to
+    # one function only sends that function upstream. Misses are packed into
+    # batches under the prompt token budget and sent in parallel.
+    with stage("generate_ai", "cache"):
+        blocks, keys, missing = _cached_blocks(payload, units)
+    with stage("generate_ai", "prompt"):
+        jobs = _batch_prompts(payload, lang_config, units, keys, missing)
+        if not units:
+            prompt = AI_FILE_PROMPT.format(
+                test_framework=lang_config["test_framework"],
+                language=payload.language,
+                symbol_section="(infer from source code)",
+                framework_hints=lang_config["framework_hints"],
+                source=payload.source,
+            )
+            blocks.append(None)
+            jobs.append({"indexes": [0], "keys": [None], "symbols": [], "prompt": prompt})
 
-    prompt = f"""Generate a complete {lang_config['test_framework']} test file for the following {payload.language} code.
+    return {
+        "lang_config": lang_config,
+        "symbols": symbols,
+        "units": units,
+        "blocks": blocks,
+        "jobs": jobs,
+        "misses": len(missing),
+        "api_key": api_key,
+    }
 
-{symbol_section}
 
-Instructions: {lang_config['framework_hints']}
-Include all imports. Output ONLY raw code, no markdown fences.
+def _cached_blocks(payload: AIGenerateRequest, units: List[dict]):
+    blocks = []
+    keys = []
+    missing = []
+    for unit in units:
+        key = block_key(
+            unit["source"],
+            language=payload.language,
+            model=AI_MODEL,
+            temperature=AI_TEMPERATURE,
+            template=AI_TEMPLATE_VERSION,
+            module=payload.filename,
+            imports=unit["imports"],
+            context=unit["context"],
+        )
+        cached = block_cache.get(key)
+        blocks.append(cached)
+        keys.append(key)
+        if cached is None:
+            missing.append(len(blocks) - 1)
+    return blocks, keys, missing
 
-Source code:
-{payload.source}"""
 
-    try:
-        client = OpenAI(api_key=api_key)
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            temperature=0.2,
-            max_tokens=4096,
-            messages=[
-                {"role": "system", "content": "You write clean, correct unit tests. Never use markdown fences."},
-                {"role": "user", "content": prompt}
-            ]
+def _batch_prompts(payload: AIGenerateRequest, lang_config: dict, units: List[dict],
+                   keys: List[str], missing: List[int]) -> List[dict]:
+    jobs = []
+    for batch in pack_batches([units[i] for i in missing]):
+        indexes = [missing[i] for i in batch]
+        context = batch_context([units[i] for i in indexes])
+        prompt = AI_BATCH_PROMPT.format(
+            test_framework=lang_config["test_framework"],
+            language=payload.language,
+            module=payload.filename,
+            names=", ".join(units[i]["name"] for i in indexes),
+            framework_hints=lang_config["framework_hints"],
+            block_hints=lang_config["block_hints"],
+            marker=f"{lang_config['comment_prefix']} testgenie:",
+            context="\n\n".join(context) or "(none)",
+            sources="\n\n".join(units[i]["source"] for i in indexes),
         )
-        generated = response.choices[0].message.content or ""
-        generated = generated.replace("```python", "").replace("```javascript", "").replace("```java", "").replace("```", "").strip()
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"OpenAI error: {e}")
+        jobs.append({
+            "indexes": indexes,
+            "keys": [keys[i] for i in indexes],
+            "symbols": [units[i]["name"] for i in indexes],
+            "prompt": prompt,
+        })
+    return jobs
+
+
+def _split_batch(content: str, names: List[str], comment_prefix: str) -> Optional[List[str]]:
+    """Split a batch completion on its per-symbol marker lines, or None if markers are missing."""
+    marker = re.compile(rf"^[ \t]*{re.escape(comment_prefix)}\s*testgenie:\s*(.+?)\s*$", re.M)
+    matches = list(marker.finditer(content))
+    if not matches:
+        return [content] if len(names) <= 1 else None
+    preamble = content[:matches[0].start()].strip()
+    sections = {}
+    for i, match in enumerate(matches):
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(content)
+        sections.setdefault(match.group(1), []).append(content[match.end():end].strip())
+    if any(name not in sections for name in names):
+        return None
+    return ["\n\n".join(p for p in [preamble, *sections[name]] if p) for name in names]
 
+
+def _store_batch(plan: dict, job: dict, content: str) -> List[str]:
+    """Split a batch completion into the plan's blocks and cache them. Writes SQLite; run it in a thread."""
+    parts = _split_batch(content, job["symbols"], plan["lang_config"]["comment_prefix"])
+    if parts is None:
+        # Keep the output but do not cache it under per-symbol keys.
+        parts = [content] + [""] * (len(job["indexes"]) - 1)
+        keys = [None] * len(job["indexes"])
+    else:
+        keys = job["keys"]
+    for index, key, part in zip(job["indexes"], keys, parts):
+        plan["blocks"][index] = part
+        if key is not None:
+            block_cache.put(key, part)
+    block_cache.maybe_prune()
+    return parts
+
+
+def _ai_response(payload: AIGenerateRequest, plan: dict) -> AIGenerateResponse:
+    lang_config = plan["lang_config"]
+    symbols = plan["symbols"]
     suffix = lang_config["test_file_suffix"]
     ext    = lang_config["test_file_extension"]
     test_filename = f"{payload.filename}{suffix}{ext}"
 
+    if plan["units"]:
+        with stage("generate_ai", "assemble"):
+            generated = assemble_test_file(plan["blocks"], payload.language, f"{payload.filename}{suffix}")
+    else:
+        generated = plan["blocks"][0]
+    misses = plan["misses"]
+
     return AIGenerateResponse(
         filename=test_filename,
         content=generated,
@@ -227,4 +524,798 @@ Source code:
         classes_found=[s["name"] for s in symbols if s["type"] == "class"],
         language=payload.language,
         test_framework=lang_config["test_framework"],
+        cache_hits=len(plan["units"]) - misses,
+        cache_misses=misses,
+    )
+
+
+async def gather_bounded(aws, limit: int = AI_BATCH_PARALLELISM) -> list:
+    """asyncio.gather(..., return_exceptions=True) with at most ``limit`` awaitables running."""
+    semaphore = asyncio.Semaphore(limit)
+
+    async def run(aw):
+        async with semaphore:
+            return await aw
+
+    return await asyncio.gather(*(run(aw) for aw in aws), return_exceptions=True)
+
+
+async def run_ai_generation(payload: AIGenerateRequest) -> AIGenerateResponse:
+    plan = await asyncio.to_thread(_plan_ai_generation, payload)
+    jobs = plan["jobs"]
+    results = await gather_bounded(_complete_or_http_error(job["prompt"], plan["api_key"]) for job in jobs)
+    for job, result in zip(jobs, results):
+        if not isinstance(result, BaseException):
+            await asyncio.to_thread(_store_batch, plan, job, result)
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+    return await _validated_ai_response(payload, _ai_response(payload, plan))
+
+
+async def _validated_ai_response(payload: AIGenerateRequest, response: AIGenerateResponse) -> AIGenerateResponse:
+    if not payload.validation:
+        return response
+    if response.test_framework != "pytest":
+        response.validation = {"mode": payload.validation, "ok": None,
+                               "errors": ["Validation is only available for pytest files."]}
+        return response
+    # The tests import the module under test by its file name.
+    modules = {validation.module_filename(payload.filename or "source"): payload.source}
+    response.validation = await validate_generated(
+        {"content": response.content, "filename": response.filename}, payload.validation, "generate_ai", modules,
     )
+    return response
+
+
+@app.post("/generate/ai", response_model=AIGenerateResponse)
+async def generate_ai(payload: AIGenerateRequest):
+    response = await run_ai_generation(payload)
+    with stage("generate_ai", "serialize"):
+        return JSONResponse(_model_dict(response))
+
+
+class FenceStripper:
+    """Strips Markdown code fences from a streamed completion as it arrives.
+
+    Fences are removed in a single left-to-right pass: each ``` together
+    with a language tag directly after it. For ordinarily fenced output this
+    gives the same text as ``_strip_fences``, and the result does not depend
+    on where the chunks are split. ``_strip_fences`` replaces one pattern at a
+    time, though, so the two differ on runs of four or more backticks and on
+    some overlapping fences (``"a````java"`` gives ``"a`java"`` here but
+    ``"a`"`` there).
+
+    Text that could still turn out to be part of a fence, or trailing
+    whitespace that ``strip()`` would remove, is held back until more input
+    (or ``flush``) settles it.
+    """
+
+    FENCE = "```"
+    TAGS = ("python", "javascript", "java")
+
+    def __init__(self):
+        self._pending = ""
+        self._space = ""
+        self._started = False
+
+    def feed(self, chunk: str) -> str:
+        self._pending += chunk
+        return self._drain(final=False)
+
+    def flush(self) -> str:
+        text = self._drain(final=True)
+        self._space = ""
+        return text
+
+    def _tag_length(self, rest: str, final: bool) -> Optional[int]:
+        if not final and any(len(rest) < len(tag) and tag.startswith(rest) for tag in self.TAGS):
+            return None
+        for tag in self.TAGS:
+            if rest.startswith(tag):
+                return len(tag)
+        return 0
+
+    def _drain(self, final: bool) -> str:
+        out = []
+        while True:
+            i = self._pending.find(self.FENCE)
+            if i == -1:
+                keep = 0 if final else len(self._pending) - len(self._pending.rstrip("`"))
+                out.append(self._pending[:len(self._pending) - keep])
+                self._pending = self._pending[len(self._pending) - keep:]
+                break
+            tag = self._tag_length(self._pending[i + len(self.FENCE):], final)
+            if tag is None:
+                out.append(self._pending[:i])
+                self._pending = self._pending[i:]
+                break
+            out.append(self._pending[:i])
+            self._pending = self._pending[i + len(self.FENCE) + tag:]
+
+        text = "".join(out)
+        if not self._started:
+            text = text.lstrip()
+            if not text:
+                return ""
+            self._started = True
+        text = self._space + text
+        body = text.rstrip()
+        self._space = text[len(body):]
+        return body
+
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def _model_dict(model: BaseModel, **kwargs) -> dict:
+    dump = getattr(model, "model_dump", None) or model.dict
+    return dump(**kwargs)
+
+
+@app.post("/generate/ai/stream")
+async def generate_ai_stream(payload: AIGenerateRequest):
+    """Server-sent events variant of /generate/ai.
+
+    Emits ``token`` events (``{"symbols", "text"}``, naming the batch the
+    tokens belong to) as upstream tokens arrive, one ``block`` event per
+    finished symbol (cached ones first), then a ``done`` event carrying the
+    full AIGenerateResponse. Failures after the stream has started are
+    reported as an ``error`` event.
+    """
+    plan = await asyncio.to_thread(_plan_ai_generation, payload)
+
+    async def events():
+        for unit, block in zip(plan["units"], plan["blocks"]):
+            if block is not None:
+                yield _sse("block", {"symbol": unit["name"], "text": block, "cached": True})
+
+        queue_ = asyncio.Queue()
+
+        async def stream_job(job):
+            stripper = FenceStripper()
+            parts = []
+            messages = [
+                {"role": "system", "content": AI_SYSTEM_PROMPT},
+                {"role": "user", "content": job["prompt"]},
+            ]
+            # Fence stripping is interleaved with the token stream, so its
+            # time is summed per call and taken out of the upstream stage.
+            strip_seconds = 0.0
+            started = time.perf_counter()
+            try:
+                async for delta in llm.stream(messages, api_key=plan["api_key"], model=AI_MODEL,
+                                              temperature=AI_TEMPERATURE):
+                    strip_started = time.perf_counter()
+                    text = stripper.feed(delta)
+                    strip_seconds += time.perf_counter() - strip_started
+                    if text:
+                        parts.append(text)
+                        await queue_.put(("token", {"symbols": job["symbols"], "text": text}))
+            finally:
+                observe("generate_ai_stream", "upstream", time.perf_counter() - started - strip_seconds)
+            strip_started = time.perf_counter()
+            parts.append(stripper.flush())
+            observe("generate_ai_stream", "fence_strip", strip_seconds + time.perf_counter() - strip_started)
+            content = "".join(parts)
+            parts = await asyncio.to_thread(_store_batch, plan, job, content)
+            for symbol, part in zip(job["symbols"] or [None], parts):
+                await queue_.put(("block", {"symbol": symbol, "text": part, "cached": False}))
+
+        semaphore = asyncio.Semaphore(AI_BATCH_PARALLELISM)
+
+        async def run(job):
+            try:
+                async with semaphore:
+                    await stream_job(job)
+            except llm.LLMBusyError as e:
+                await queue_.put(("error", {"status_code": 429, "detail": str(e), "retry_after": e.retry_after}))
+            except Exception as e:
+                await queue_.put(("error", {"status_code": 500, "detail": f"OpenAI error: {e}"}))
+            finally:
+                await queue_.put(None)
+
+        tasks = [asyncio.ensure_future(run(job)) for job in plan["jobs"]]
+        try:
+            remaining = len(tasks)
+            while remaining:
+                item = await queue_.get()
+                if item is None:
+                    remaining -= 1
+                    continue
+                yield _sse(*item)
+                if item[0] == "error":
+                    return
+            response = await _validated_ai_response(payload, _ai_response(payload, plan))
+            yield _sse("done", _model_dict(response))
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# ── Incremental parse sessions (editor clients send edit deltas) ──────────────
+
+MAX_SESSIONS = int(os.getenv("TESTGENIE_MAX_SESSIONS", "256"))
+SESSION_TTL = float(os.getenv("TESTGENIE_SESSION_TTL", "1800"))
+
+
+class TextPosition(BaseModel):
+    line: int
+    character: int
+
+class TextRange(BaseModel):
+    start: TextPosition
+    end: TextPosition
+
+class ContentChange(BaseModel):
+    # Mirrors VS Code's TextDocumentContentChangeEvent: no range means full text.
+    range: Optional[TextRange] = None
+    text: str
+
+class SessionCreateRequest(BaseModel):
+    source: str
+    language: str = "python"
+    version: int = 0
+
+class SessionEditRequest(BaseModel):
+    changes: List[ContentChange]
+    version: Optional[int] = None
+
+class SessionResponse(BaseModel):
+    session_id: str
+    version: int
+    functions_found: List[str]
+    classes_found: List[str]
+    parse_ms: float
+
+
+class ParseSession:
+    def __init__(self, language_id: str, source: str, version: int):
+        self.language_id = language_id
+        self.source = source.encode("utf-8")
+        self.version = version
+        self.tree = parse_source_ai(self.source, language_id)
+        self.touched = time.monotonic()
+        self._line_starts = None
+        self._child_symbols = {}
+        self._changed = []
+
+    def _position(self, position: TextPosition):
+        """Map a line/UTF-16 character position to a byte offset and tree-sitter point."""
+        if position.line < 0 or position.character < 0:
+            raise ValueError(f"Negative position {position.line}:{position.character}.")
+        if self._line_starts is None:
+            ends = itertools.accumulate(map((1).__add__, map(len, self.source.split(b"\n"))))
+            self._line_starts = [0] + list(ends)[:-1]
+        if position.line >= len(self._line_starts):
+            last = len(self._line_starts) - 1
+            return len(self.source), (last, len(self.source) - self._line_starts[last])
+        start = self._line_starts[position.line]
+        end = self.source.find(b"\n", start)
+        if end == -1:
+            end = len(self.source)
+        units = self.source[start:end].decode("utf-8").encode("utf-16-le")[:position.character * 2]
+        column = len(units.decode("utf-16-le", errors="ignore").encode("utf-8"))
+        return start + column, (position.line, column)
+
+    def apply(self, changes: List[ContentChange]) -> None:
+        """Apply all changes or, if one is invalid (ValueError), none of them."""
+        saved = (self.source, self._line_starts, self._child_symbols)
+        try:
+            self._apply(changes)
+        except Exception:
+            self.source, self._line_starts, self._child_symbols = saved
+            raise
+
+    def _apply(self, changes: List[ContentChange]) -> None:
+        # Edit a copy so the current tree stays valid if a later change is rejected.
+        tree = self.tree.copy()
+        for change in changes:
+            new_text = change.text.encode("utf-8")
+            if change.range is None:
+                self.source = new_text
+                self._line_starts = None
+                self._child_symbols = {}
+                tree = None
+                continue
+            start_byte, start_point = self._position(change.range.start)
+            old_end_byte, old_end_point = self._position(change.range.end)
+            if start_byte > old_end_byte:
+                raise ValueError("Range start is after its end.")
+            self.source = self.source[:start_byte] + new_text + self.source[old_end_byte:]
+            lines = new_text.split(b"\n")
+            self._shift_line_starts(start_point[0], old_end_point[0], start_byte, old_end_byte, lines)
+            self._shift_child_symbols(start_byte, old_end_byte, len(new_text))
+            if len(lines) == 1:
+                new_end_point = (start_point[0], start_point[1] + len(new_text))
+            else:
+                new_end_point = (start_point[0] + len(lines) - 1, len(lines[-1]))
+            if tree is not None:
+                tree.edit(start_byte, old_end_byte, start_byte + len(new_text), start_point, old_end_point, new_end_point)
+        self.tree = parse_source_ai(self.source, self.language_id, old_tree=tree)
+        self._changed = [] if tree is None else [(r.start_byte, r.end_byte) for r in tree.changed_ranges(self.tree)]
+        self.touched = time.monotonic()
+
+    def _shift_line_starts(self, start_row: int, old_end_row: int, start_byte: int, old_end_byte: int, lines) -> None:
+        if self._line_starts is None:
+            return
+        starts = self._line_starts
+        inserted = []
+        offset = start_byte
+        for line in lines[:-1]:
+            offset += len(line) + 1
+            inserted.append(offset)
+        delta = offset + len(lines[-1]) - old_end_byte
+        self._line_starts = starts[:start_row + 1] + inserted + [x + delta for x in starts[old_end_row + 1:]]
+
+    def _shift_child_symbols(self, start_byte: int, old_end_byte: int, new_length: int) -> None:
+        # Drop cached top-level nodes the edit touches and move the ones after it.
+        delta = new_length - (old_end_byte - start_byte)
+        shifted = {}
+        for (start, end, node_type), symbols in self._child_symbols.items():
+            if end < start_byte:
+                shifted[(start, end, node_type)] = symbols
+            elif start >= old_end_byte:
+                shifted[(start + delta, end + delta, node_type)] = symbols
+        self._child_symbols = shifted
+
+    def symbols(self) -> list:
+        """Symbols of the current tree, re-querying only top-level nodes that changed."""
+        found = []
+        cache = {}
+        changed = self._changed
+        for child in self.tree.root_node.children:
+            key = (child.start_byte, child.end_byte, child.type)
+            symbols = self._child_symbols.get(key)
+            if symbols is None or (changed and any(s < key[1] and e > key[0] for s, e in changed)):
+                symbols = _symbols_in_node(child, self.language_id, with_source=False)
+            cache[key] = symbols
+            found.extend(symbols)
+        self._child_symbols = cache
+        self._changed = []
+        return _dedupe_symbols(found)
+
+
+_sessions: "OrderedDict[str, ParseSession]" = OrderedDict()
+
+
+def _evict_sessions() -> None:
+    now = time.monotonic()
+    for session_id in [k for k, v in _sessions.items() if now - v.touched > SESSION_TTL]:
+        del _sessions[session_id]
+    while len(_sessions) > MAX_SESSIONS:
+        _sessions.popitem(last=False)
+
+
+def _session_response(session_id: str, session: ParseSession, started: float) -> SessionResponse:
+    symbols = session.symbols()
+    return SessionResponse(
+        session_id=session_id,
+        version=session.version,
+        functions_found=[s["name"] for s in symbols if s["type"] == "function"],
+        classes_found=[s["name"] for s in symbols if s["type"] == "class"],
+        parse_ms=round((time.perf_counter() - started) * 1000, 3),
+    )
+
+
+@app.post("/sessions", response_model=SessionResponse)
+async def create_session(payload: SessionCreateRequest):
+    if payload.language not in AI_LANGUAGES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unsupported language '{payload.language}'. Supported: {list(AI_LANGUAGES.keys())}"
+        )
+    started = time.perf_counter()
+    session_id = uuid.uuid4().hex
+    session = ParseSession(payload.language, payload.source, payload.version)
+    _sessions[session_id] = session
+    _evict_sessions()
+    return _session_response(session_id, session, started)
+
+
+@app.post("/sessions/{session_id}/edits", response_model=SessionResponse)
+async def edit_session(session_id: str, payload: SessionEditRequest):
+    session = _sessions.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired session.")
+    _sessions.move_to_end(session_id)
+    started = time.perf_counter()
+    try:
+        session.apply(payload.changes)
+    except (UnicodeDecodeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Failed to apply edits: {e}")
+    if payload.version is not None:
+        session.version = payload.version
+    return _session_response(session_id, session, started)
+
+
+@app.delete("/sessions/{session_id}")
+async def delete_session(session_id: str):
+    if _sessions.pop(session_id, None) is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired session.")
+    return {"status": "deleted"}
+
+
+# ── Project-wide batch generation (many files or a repo archive) ────────────
+
+from concurrent.futures import ProcessPoolExecutor
+from fastapi import Request
+import multiprocessing
+import posixpath
+import tarfile
+import tempfile
+import zipfile
+import zlib
+
+BATCH_WORKERS = int(os.getenv("TESTGENIE_BATCH_WORKERS", "0")) or os.cpu_count() or 1
+BATCH_MAX_FILE_BYTES = int(os.getenv("TESTGENIE_BATCH_MAX_FILE_BYTES", str(1024 * 1024)))
+BATCH_MAX_UPLOAD_BYTES = int(os.getenv("TESTGENIE_BATCH_MAX_UPLOAD_BYTES", str(512 * 1024 * 1024)))
+BATCH_SPOOL_BYTES = 8 * 1024 * 1024
+NDJSON_CONTENT_TYPES = {"application/x-ndjson", "application/jsonl", "application/json"}
+TAR_CONTENT_TYPES = {
+    "application/x-tar", "application/gzip", "application/x-gzip",
+    "application/x-gtar", "application/x-compressed-tar",
+}
+ZIP_CONTENT_TYPES = {"application/zip", "application/x-zip-compressed"}
+
+_process_pool: Optional[ProcessPoolExecutor] = None
+
+
+def _get_process_pool() -> ProcessPoolExecutor:
+    global _process_pool
+    if _process_pool is None:
+        # Forking this process directly would copy it mid-request: other
+        # threads (archive readers, the event loop) and open SQLite handles.
+        # Forkserver workers start clean and import this module once.
+        context = None
+        if "forkserver" in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context("forkserver")
+        _process_pool = ProcessPoolExecutor(max_workers=BATCH_WORKERS, mp_context=context)
+    return _process_pool
+
+
+def process_batch_file(path: str, data: bytes) -> dict:
+    """Generate tests (Python) or extract symbols (other languages) for one file.
+
+    Runs in a worker process; failures are returned as a result, never raised.
+    """
+    language = AI_LANGUAGES.language_for_extension(posixpath.splitext(path)[1])
+    try:
+        source = data.decode("utf-8")
+        if language == "python":
+            result = generate_tests_from_source(source)
+            stem = posixpath.splitext(posixpath.basename(path))[0]
+            result["filename"] = f"test_{stem}.py"
+        else:
+            symbols = extract_symbols_ai(source, language)
+            result = {
+                "functions_found": [s["name"] for s in symbols if s["type"] == "function"],
+                "classes_found": [s["name"] for s in symbols if s["type"] == "class"],
+            }
+    except Exception as e:
+        return {"path": path, "language": language, "ok": False, "error": str(e)}
+    return {"path": path, "language": language, "ok": True, **result}
+
+
+def _batch_entry(path: str, size: int):
+    """Whether to process a file, and the inline error for one that is too large."""
+    if AI_LANGUAGES.language_for_extension(posixpath.splitext(path)[1]) is None:
+        return False, None
+    if size > BATCH_MAX_FILE_BYTES:
+        return True, f"File is larger than {BATCH_MAX_FILE_BYTES} bytes."
+    return True, None
+
+
+def _iter_ndjson(spool):
+    """(path, data, error) per ``{"path", "source"}`` line of an NDJSON body."""
+    max_line = BATCH_MAX_FILE_BYTES * 2
+    while True:
+        line = spool.readline(max_line)
+        if not line:
+            return
+        if len(line) == max_line and not line.endswith(b"\n"):
+            while line and not line.endswith(b"\n"):
+                line = spool.readline(max_line)
+            yield None, None, "NDJSON line too long."
+            continue
+        if not line.strip():
+            continue
+        try:
+            item = json.loads(line)
+            path, data = str(item["path"]), item["source"].encode("utf-8")
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            yield None, None, f"Invalid NDJSON line: {e}"
+            continue
+        wanted, error = _batch_entry(path, len(data))
+        if wanted:
+            yield path, (None if error else data), error
+
+
+# A damaged or unsupported member (bad CRC, truncated deflate data, an
+# encrypted or unknown compression method) fails only its own file.
+MEMBER_READ_ERRORS = (zipfile.BadZipFile, zlib.error, EOFError, OSError, NotImplementedError, RuntimeError)
+
+
+def _read_member(path: str, read):
+    try:
+        return path, read(), None
+    except MEMBER_READ_ERRORS as e:
+        return path, None, f"Failed to read file: {e}"
+
+
+def _iter_upload(spool, kind: str):
+    if kind == "ndjson":
+        yield from _iter_ndjson(spool)
+    elif kind == "zip":
+        with zipfile.ZipFile(spool) as archive:
+            for info in archive.infolist():
+                if info.is_dir():
+                    continue
+                wanted, error = _batch_entry(info.filename, info.file_size)
+                if wanted and error:
+                    yield info.filename, None, error
+                elif wanted:
+                    yield _read_member(info.filename, lambda: archive.read(info))
+    else:
+        # Stream mode reads members sequentially, so compressed tars are
+        # never decompressed as a whole.
+        with tarfile.open(fileobj=spool, mode="r|*") as archive:
+            for member in archive:
+                if not member.isfile():
+                    continue
+                wanted, error = _batch_entry(member.name, member.size)
+                if wanted and error:
+                    yield member.name, None, error
+                elif wanted:
+                    yield _read_member(member.name, lambda: archive.extractfile(member).read())
+
+
+async def _upload_entries(spool, kind: str):
+    iterator = _iter_upload(spool, kind)
+    try:
+        while True:
+            entry = await asyncio.to_thread(next, iterator, None)
+            if entry is None:
+                break
+            yield entry
+    except (tarfile.TarError, zipfile.BadZipFile, zlib.error, EOFError, OSError) as e:
+        # Only a broken archive stream (a tar cannot skip a damaged member) gets here.
+        yield None, None, f"Failed to read upload: {e}"
+    finally:
+        spool.close()
+
+
+async def _spool_body(request: Request):
+    """Copy the request body to a temp file that only stays in memory while small."""
+    spool = tempfile.SpooledTemporaryFile(max_size=BATCH_SPOOL_BYTES)
+    total = 0
+    async for chunk in request.stream():
+        total += len(chunk)
+        if total > BATCH_MAX_UPLOAD_BYTES:
+            spool.close()
+            raise HTTPException(status_code=413, detail=f"Upload is larger than {BATCH_MAX_UPLOAD_BYTES} bytes.")
+        spool.write(chunk)
+    spool.seek(0)
+    return spool
+
+
+async def _run_batch(entries):
+    loop = asyncio.get_running_loop()
+    pool = _get_process_pool()
+    pending = {}
+    counts = {"files": 0, "ok": 0, "failed": 0}
+
+    def line(result: dict) -> str:
+        counts["files"] += 1
+        counts["ok" if result["ok"] else "failed"] += 1
+        return json.dumps(result) + "\n"
+
+    def finished(future) -> dict:
+        path = pending.pop(future)
+        try:
+            return future.result()
+        except Exception as e:
+            return {"path": path, "ok": False, "error": f"Worker failed: {e}"}
+
+    try:
+        async for path, data, error in entries:
+            if error is not None:
+                yield line({"path": path, "ok": False, "error": error})
+                continue
+            # Emit whatever is ready, and hold off reading more input while
+            # the pool is saturated so memory stays bounded.
+            for future in [f for f in pending if f.done()]:
+                yield line(finished(future))
+            while len(pending) >= BATCH_WORKERS * 2:
+                done, _ = await asyncio.wait(list(pending), return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    yield line(finished(future))
+            pending[loop.run_in_executor(pool, process_batch_file, path, data)] = path
+        while pending:
+            done, _ = await asyncio.wait(list(pending), return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                yield line(finished(future))
+        yield json.dumps({"summary": counts}) + "\n"
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+@app.post("/generate/batch")
+async def generate_batch(request: Request):
+    """Generate tests for many files, streaming one NDJSON result per file.
+
+    The body is either NDJSON (one ``{"path", "source"}`` object per line) or
+    a tar/tar.gz/zip archive, selected by Content-Type. Python files get the
+    deterministic ``/generate`` tests; JavaScript and Java files get their
+    functions and classes. Other files are skipped. A final ``summary`` line
+    counts the results.
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if content_type in NDJSON_CONTENT_TYPES:
+        kind = "ndjson"
+    elif content_type in TAR_CONTENT_TYPES:
+        kind = "tar"
+    elif content_type in ZIP_CONTENT_TYPES:
+        kind = "zip"
+    else:
+        raise HTTPException(
+            status_code=415,
+            detail="Send NDJSON (application/x-ndjson) or a tar/zip archive.",
+        )
+    # Spool before responding: once a streaming response starts, Starlette
+    # reads the same receive channel to watch for client disconnects.
+    spool = await _spool_body(request)
+    if kind == "zip" and not zipfile.is_zipfile(spool):
+        spool.close()
+        raise HTTPException(status_code=400, detail="Upload is not a valid zip archive.")
+    spool.seek(0)
+    entries = _upload_entries(spool, kind)
+    return StreamingResponse(_run_batch(entries), media_type="application/x-ndjson")
+
+
+# ── Background jobs (submit, poll, fetch result, cancel) ─────────────────────
+
+from fastapi import Response
+from backend import jobs
+
+job_queue = jobs.JobQueue()
+
+
+class JobResponse(BaseModel):
+    id: str
+    kind: str
+    priority: str
+    status: str
+    error: Optional[str] = None
+    attempts: int = 0
+    created: float
+    started: Optional[float] = None
+    finished: Optional[float] = None
+
+
+async def _generate_job(payload: dict) -> dict:
+    try:
+        result = await asyncio.to_thread(generate_tests_from_source, payload["source"])
+    except ValueError as e:
+        raise jobs.JobFailed(str(e), status_code=400)
+    if payload.get("validation"):
+        result["validation"] = await validate_generated(result, payload["validation"], "generate")
+    return result
+
+
+async def _generate_ai_job(payload: dict) -> dict:
+    try:
+        response = await run_ai_generation(AIGenerateRequest(**payload))
+    except HTTPException as e:
+        if e.status_code == 429:
+            # Upstream is saturated; wait in the job queue instead of failing.
+            raise jobs.RetryLater(int(e.headers["Retry-After"]), str(e.detail), status_code=503)
+        raise jobs.JobFailed(str(e.detail), status_code=e.status_code)
+    return _model_dict(response)
+
+
+job_queue.register("generate", _generate_job)
+job_queue.register("generate_ai", _generate_ai_job)
+
+
+async def _submit_job(kind: str, payload: dict, priority: str, secrets: Optional[dict] = None) -> dict:
+    if priority not in jobs.PRIORITIES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown priority '{priority}'. Supported: {list(jobs.PRIORITIES.keys())}"
+        )
+    try:
+        return await job_queue.submit(kind, payload, priority, secrets=secrets)
+    except jobs.QueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+
+def _get_job(job_id: str, with_result: bool = False) -> dict:
+    job = job_queue.get(job_id, with_result=with_result)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job.")
+    return job
+
+
+@app.post("/jobs/generate", response_model=JobResponse, status_code=202)
+async def submit_generate_job(payload: SourcePayload, priority: str = "bulk"):
+    require_validation_mode(payload.validation)
+    return await _submit_job("generate", _model_dict(payload), priority)
+
+
+@app.post("/jobs/generate/ai", response_model=JobResponse, status_code=202)
+async def submit_generate_ai_job(payload: AIGenerateRequest, priority: str = "bulk"):
+    require_validation_mode(payload.validation)
+    # The API key is kept in memory only, never written to the job store.
+    return await _submit_job(
+        "generate_ai", _model_dict(payload, exclude={"api_key"}), priority,
+        secrets={"api_key": payload.api_key} if payload.api_key else None,
+    )
+
+
+@app.get("/jobs/{job_id}", response_model=JobResponse)
+async def get_job(job_id: str):
+    return _get_job(job_id)
+
+
+@app.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str, response: Response):
+    """The handler's result once the job succeeded; its error if it failed."""
+    job = _get_job(job_id, with_result=True)
+    if job["status"] == "succeeded":
+        return job["result"]
+    if job["status"] == "failed":
+        raise HTTPException(status_code=job["error_status"] or 500, detail=job["error"])
+    if job["status"] == "cancelled":
+        raise HTTPException(status_code=409, detail="Job was cancelled.")
+    response.status_code = 202
+    return {"id": job["id"], "status": job["status"]}
+
+
+@app.delete("/jobs/{job_id}", response_model=JobResponse)
+async def cancel_job(job_id: str):
+    _get_job(job_id)
+    return job_queue.cancel(job_id)
+
+
+# ── Metrics (Prometheus) ────────────────────────────────────────────────────
+
+from backend import metrics
+
+app.add_middleware(metrics.MetricsMiddleware)
+
+metrics.gauge("testgenie_upstream_in_flight", "Upstream calls holding a slot.", lambda: llm.limiter.in_flight)
+metrics.gauge("testgenie_upstream_waiting", "Upstream calls waiting for a slot.", lambda: llm.limiter.waiting)
+metrics.gauge("testgenie_jobs_queued", "Background jobs waiting for a worker.", lambda: job_queue.queued)
+metrics.gauge("testgenie_jobs_running", "Background jobs being run.", lambda: job_queue.in_flight)
+metrics.gauge("testgenie_sessions_open", "Incremental parse sessions kept in memory.", lambda: len(_sessions))
+
+
+@app.get("/metrics")
+async def get_metrics():
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
+
+
+# ── Lifecycle ───────────────────────────────────────────────────────────────
+
+@app.on_event("startup")
+async def start_background_workers():
+    await job_queue.start()
+
+
+@app.on_event("shutdown")
+async def close_shared_resources():
+    await job_queue.stop()
+    await llm.close_clients()
+    validation.pool.close()
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,132 @@
+"""Content-addressed cache of generated test blocks.
+
+Blocks are keyed by a hash of the normalized symbol source and everything
+that influences generation (language, model, temperature, prompt template).
+A small in-memory LRU sits in front of a persistent SQLite tier that is
+pruned by total size and entry age.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import textwrap
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+MEMORY_ENTRIES = int(os.getenv("TESTGENIE_CACHE_MEMORY_ENTRIES", "2048"))
+DISK_PATH = os.getenv(
+    "TESTGENIE_CACHE_PATH",
+    os.path.join(os.path.expanduser("~"), ".cache", "testgenie", "blocks.sqlite3"),
+)
+DISK_MAX_BYTES = int(os.getenv("TESTGENIE_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+DISK_MAX_AGE = float(os.getenv("TESTGENIE_CACHE_MAX_AGE", str(30 * 24 * 3600)))
+PRUNE_EVERY = 256
+
+
+def normalize_source(source: str) -> str:
+    """Strip formatting noise that does not change what a symbol does."""
+    lines = source.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+    lines = [line.rstrip() for line in lines if line.strip()]
+    return textwrap.dedent("\n".join(lines))
+
+
+def block_key(source: str, **params) -> str:
+    blob = json.dumps(params, sort_keys=True) + "\0" + normalize_source(source)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class BlockCache:
+    def __init__(self, memory_entries: int = MEMORY_ENTRIES, path: Optional[str] = DISK_PATH,
+                 max_bytes: int = DISK_MAX_BYTES, max_age: float = DISK_MAX_AGE):
+        self.memory_entries = memory_entries
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        # key -> (content, created), so memory hits honour max_age like the disk tier.
+        self._memory: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._puts = 0
+        self._path = path
+        self._conn: Optional[sqlite3.Connection] = None
+
+    @property
+    def _db(self) -> Optional[sqlite3.Connection]:
+        # Opened on first use rather than at import, so a pre-forking server
+        # master never hands one SQLite connection to all of its workers.
+        if self._conn is None and self._path:
+            os.makedirs(os.path.dirname(os.path.abspath(self._path)), exist_ok=True)
+            db = sqlite3.connect(self._path, check_same_thread=False, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS blocks ("
+                " key TEXT PRIMARY KEY, content TEXT NOT NULL, size INTEGER NOT NULL,"
+                " created REAL NOT NULL, last_used REAL NOT NULL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS blocks_last_used ON blocks (last_used)")
+            db.execute("CREATE INDEX IF NOT EXISTS blocks_created ON blocks (created)")
+            self._conn = db
+        return self._conn
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            now = time.time()
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry[1] >= now - self.max_age:
+                    self._memory.move_to_end(key)
+                    return entry[0]
+                del self._memory[key]
+            if self._db is None:
+                return None
+            row = self._db.execute(
+                "SELECT content, created FROM blocks WHERE key = ? AND created >= ?", (key, now - self.max_age)
+            ).fetchone()
+            if row is None:
+                return None
+            self._db.execute("UPDATE blocks SET last_used = ? WHERE key = ?", (now, key))
+            self._remember(key, row[0], row[1])
+            return row[0]
+
+    def put(self, key: str, content: str) -> None:
+        with self._lock:
+            now = time.time()
+            self._remember(key, content, now)
+            if self._db is None:
+                return
+            self._db.execute(
+                "INSERT OR REPLACE INTO blocks (key, content, size, created, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, content, len(content.encode("utf-8")), now, now),
+            )
+            self._puts += 1
+
+    def maybe_prune(self) -> None:
+        """Prune once every ``PRUNE_EVERY`` puts. It scans the table; call it off the event loop."""
+        if self._puts >= PRUNE_EVERY:
+            self.prune()
+
+    def prune(self) -> None:
+        with self._lock:
+            self._puts = 0
+            if self._db is not None:
+                self._prune(time.time())
+
+    def _remember(self, key: str, content: str, created: float) -> None:
+        self._memory[key] = (content, created)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _prune(self, now: float) -> None:
+        self._db.execute("DELETE FROM blocks WHERE created < ?", (now - self.max_age,))
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM blocks").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Least recently used rows until the excess is covered, in one statement.
+        self._db.execute(
+            "DELETE FROM blocks WHERE key IN ("
+            " SELECT key FROM (SELECT key, size, SUM(size) OVER (ORDER BY last_used, key) AS running FROM blocks)"
+            " WHERE running - size < ?)",
+            (total - self.max_bytes,),
+        )
@@ -0,0 +1,358 @@
+"""Durable background jobs for long-running generation.
+
+Jobs are persisted in SQLite and executed by a fixed pool of asyncio
+workers pulling from a priority queue, so interactive requests overtake
+bulk ones and load spikes wait in a bounded queue instead of holding HTTP
+connections open. Queued and interrupted jobs are picked up again when the
+queue starts, so they survive a restart (execution is at-least-once).
+
+Several processes may share one store. A process leases each job it runs
+and renews the lease while the job is running. Jobs whose lease has
+expired, because their process died, are queued again by whichever
+process notices first.
+"""
+
+import asyncio
+import heapq
+import itertools
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Awaitable, Callable, Dict, Optional
+
+WORKERS = int(os.getenv("TESTGENIE_JOB_WORKERS", "8"))
+MAX_QUEUED = int(os.getenv("TESTGENIE_JOB_MAX_QUEUED", "1000"))
+RESULT_TTL = float(os.getenv("TESTGENIE_JOB_RESULT_TTL", str(24 * 3600)))
+DB_PATH = os.getenv(
+    "TESTGENIE_JOB_PATH",
+    os.path.join(os.path.expanduser("~"), ".cache", "testgenie", "jobs.sqlite3"),
+)
+LEASE_SECONDS = float(os.getenv("TESTGENIE_JOB_LEASE", "60"))
+MAX_ATTEMPTS = int(os.getenv("TESTGENIE_JOB_MAX_ATTEMPTS", "10"))
+PRIORITIES = {"interactive": 0, "bulk": 1}
+# Bulk jobs may fill at most this share of the queue, so interactive
+# requests are still accepted while a CI run is queued.
+BULK_QUEUE_SHARE = 0.9
+PRUNE_EVERY = 256
+
+Handler = Callable[[dict], Awaitable[dict]]
+
+
+class QueueFullError(Exception):
+    """Raised by ``submit`` when the queue has no room for the job's priority."""
+
+    def __init__(self, message: str, retry_after: int = 1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class JobFailed(Exception):
+    """Raised by handlers for an expected failure, reported with ``status_code``."""
+
+    def __init__(self, message: str, status_code: int = 500):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class RetryLater(Exception):
+    """Raised by handlers to put the job back in the queue after ``delay`` seconds.
+
+    Once the job has been attempted ``max_attempts`` times it fails instead,
+    with ``message`` and ``status_code``.
+    """
+
+    def __init__(self, delay: float = 1.0, message: str = "Service unavailable.", status_code: int = 503):
+        super().__init__(message)
+        self.delay = delay
+        self.status_code = status_code
+
+
+class JobQueue:
+    def __init__(self, workers: int = WORKERS, max_queued: int = MAX_QUEUED,
+                 path: Optional[str] = DB_PATH, result_ttl: float = RESULT_TTL,
+                 lease: float = LEASE_SECONDS, max_attempts: int = MAX_ATTEMPTS):
+        self.workers = workers
+        self.max_queued = max_queued
+        self.result_ttl = result_ttl
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.owner = uuid.uuid4().hex
+        self._handlers: Dict[str, Handler] = {}
+        self._heap = []
+        # Jobs in this process's heap; the store is shared, so a queued row
+        # may be in another process's heap instead.
+        self._pushed: Dict[str, int] = {}
+        self._seq = itertools.count()
+        self._ready: Optional[asyncio.Condition] = None
+        self._tasks = []
+        self._running: Dict[str, asyncio.Task] = {}
+        self._cancelled = set()
+        self._delayed = set()
+        self._queued = {priority: 0 for priority in PRIORITIES.values()}
+        self._avg_seconds = 1.0
+        self._finished = 0
+        # Secrets (API keys) stay in memory only; recovered jobs run without them.
+        self._secrets: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+        self._path = path
+        self._conn: Optional[sqlite3.Connection] = None
+
+    @property
+    def _db(self) -> sqlite3.Connection:
+        # Opened on first use (normally start()), not at import, so workers of
+        # a pre-forking server each get their own connection.
+        if self._conn is None:
+            if self._path:
+                os.makedirs(os.path.dirname(os.path.abspath(self._path)), exist_ok=True)
+            db = sqlite3.connect(self._path or ":memory:", check_same_thread=False, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " id TEXT PRIMARY KEY, kind TEXT NOT NULL, priority INTEGER NOT NULL,"
+                " status TEXT NOT NULL, payload TEXT NOT NULL, result TEXT, error TEXT,"
+                " error_status INTEGER, attempts INTEGER NOT NULL DEFAULT 0,"
+                " created REAL NOT NULL, started REAL, finished REAL, owner TEXT, lease_until REAL)"
+            )
+            columns = {row[1] for row in db.execute("PRAGMA table_info(jobs)")}
+            for column, kind in (("owner", "TEXT"), ("lease_until", "REAL")):
+                if column not in columns:
+                    db.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+            db.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, priority, created)")
+            self._conn = db
+        return self._conn
+
+    @property
+    def queued(self) -> int:
+        return sum(self._queued.values())
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._running)
+
+    def register(self, kind: str, handler: Handler) -> None:
+        self._handlers[kind] = handler
+
+    async def start(self) -> None:
+        self._ready = asyncio.Condition()
+        with self._lock:
+            self._recover(time.time())
+            rows = self._db.execute(
+                "SELECT id, priority FROM jobs WHERE status = 'queued' ORDER BY created"
+            ).fetchall()
+            self._prune(time.time())
+        for job_id, priority in rows:
+            self._push(job_id, priority)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._heartbeat()))
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        # Hand interrupted jobs back now rather than when their lease expires.
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET status = 'queued', started = NULL, owner = NULL, lease_until = NULL"
+                " WHERE owner = ? AND status = 'running'",
+                (self.owner,),
+            )
+
+    async def submit(self, kind: str, payload: dict, priority: str = "bulk",
+                     secrets: Optional[dict] = None) -> dict:
+        if kind not in self._handlers:
+            raise ValueError(f"Unknown job kind '{kind}'.")
+        level = PRIORITIES[priority]
+        limit = self.max_queued if level == 0 else int(self.max_queued * BULK_QUEUE_SHARE)
+        if self.queued >= limit:
+            raise QueueFullError("Job queue is full.", retry_after=self._retry_after())
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO jobs (id, kind, priority, status, payload, created) VALUES (?, ?, ?, 'queued', ?, ?)",
+                (job_id, kind, level, json.dumps(payload), time.time()),
+            )
+        if secrets:
+            self._secrets[job_id] = secrets
+        self._push(job_id, level)
+        async with self._ready:
+            self._ready.notify()
+        return self.get(job_id)
+
+    def get(self, job_id: str, with_result: bool = False) -> Optional[dict]:
+        columns = "id, kind, priority, status, error, error_status, attempts, created, started, finished"
+        with self._lock:
+            row = self._db.execute(
+                f"SELECT {columns}{', result' if with_result else ''} FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        job = dict(zip(columns.split(", ") + (["result"] if with_result else []), row))
+        job["priority"] = next(name for name, level in PRIORITIES.items() if level == job["priority"])
+        if with_result and job["result"] is not None:
+            job["result"] = json.loads(job["result"])
+        return job
+
+    def cancel(self, job_id: str) -> Optional[dict]:
+        """Cancel a queued or running job; finished jobs are returned unchanged."""
+        with self._lock:
+            cursor = self._db.execute(
+                "UPDATE jobs SET status = 'cancelled', finished = ? WHERE id = ? AND status = 'queued'",
+                (time.time(), job_id),
+            )
+        if cursor.rowcount:
+            self._secrets.pop(job_id, None)
+            if job_id in self._delayed:
+                # _requeue drops it instead of pushing it.
+                self._cancelled.add(job_id)
+            elif job_id in self._pushed:
+                # The heap entry is skipped when a worker pops it.
+                self._queued[self._pushed.pop(job_id)] -= 1
+                self._cancelled.add(job_id)
+        task = self._running.get(job_id)
+        if task is not None and task.cancel():
+            self._cancelled.add(job_id)
+        return self.get(job_id)
+
+    def _push(self, job_id: str, priority: int) -> None:
+        if job_id in self._pushed:
+            return
+        heapq.heappush(self._heap, (priority, next(self._seq), job_id))
+        self._pushed[job_id] = priority
+        self._queued[priority] += 1
+
+    def _retry_after(self) -> int:
+        return max(1, int(self.queued * self._avg_seconds / max(1, self.workers)))
+
+    async def _worker(self) -> None:
+        while True:
+            async with self._ready:
+                await self._ready.wait_for(lambda: self._heap)
+                priority, _, job_id = heapq.heappop(self._heap)
+            if job_id in self._cancelled:
+                self._cancelled.discard(job_id)
+                continue
+            self._pushed.pop(job_id, None)
+            self._queued[priority] -= 1
+            now = time.time()
+            with self._lock:
+                claimed = self._db.execute(
+                    "UPDATE jobs SET status = 'running', started = ?, attempts = attempts + 1,"
+                    " owner = ?, lease_until = ? WHERE id = ? AND status = 'queued'",
+                    (now, self.owner, now + self.lease, job_id),
+                ).rowcount
+                row = self._db.execute("SELECT kind, payload, attempts FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if claimed:
+                await self._run(job_id, priority, row[0], json.loads(row[1]), row[2])
+
+    async def _run(self, job_id: str, priority: int, kind: str, payload: dict, attempts: int) -> None:
+        payload.update(self._secrets.get(job_id, {}))
+        started = time.monotonic()
+        task = asyncio.ensure_future(self._handlers[kind](payload))
+        self._running[job_id] = task
+        status, result, error, error_status = "succeeded", None, None, None
+        try:
+            result = json.dumps(await task)
+        except RetryLater as e:
+            if attempts < self.max_attempts:
+                with self._lock:
+                    self._db.execute(
+                        "UPDATE jobs SET status = 'queued', started = NULL, owner = NULL, lease_until = NULL"
+                        " WHERE id = ? AND owner = ?",
+                        (job_id, self.owner),
+                    )
+                self._delayed.add(job_id)
+                asyncio.get_running_loop().call_later(e.delay, self._requeue, job_id, priority)
+                return
+            status, error, error_status = "failed", f"Gave up after {attempts} attempts: {e}", e.status_code
+        except asyncio.CancelledError:
+            if job_id not in self._cancelled:
+                # The worker itself is being stopped; leave the job to be recovered.
+                raise
+            self._cancelled.discard(job_id)
+            status, error, error_status = "cancelled", "Job was cancelled.", None
+        except JobFailed as e:
+            status, error, error_status = "failed", str(e), e.status_code
+        except Exception as e:
+            status, error, error_status = "failed", f"Job failed: {e}", 500
+        finally:
+            self._running.pop(job_id, None)
+        self._secrets.pop(job_id, None)
+        self._avg_seconds = 0.9 * self._avg_seconds + 0.1 * (time.monotonic() - started)
+        now = time.time()
+        with self._lock:
+            # A job whose lease was lost (this process stalled past it) now
+            # belongs to whoever requeued it; that run writes the outcome.
+            self._db.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, error_status = ?, finished = ?,"
+                " owner = NULL, lease_until = NULL WHERE id = ? AND owner = ?",
+                (status, result, error, error_status, now, job_id, self.owner),
+            )
+            self._finished += 1
+            if self._finished % PRUNE_EVERY == 0:
+                self._prune(now)
+
+    def _requeue(self, job_id: str, priority: int) -> None:
+        self._delayed.discard(job_id)
+        if job_id in self._cancelled:
+            self._cancelled.discard(job_id)
+            return
+        self._push(job_id, priority)
+        asyncio.ensure_future(self._notify())
+
+    async def _notify(self) -> None:
+        async with self._ready:
+            self._ready.notify()
+
+    async def _heartbeat(self) -> None:
+        """Renew the leases of running jobs and requeue jobs whose lease expired."""
+        while True:
+            await asyncio.sleep(self.lease / 3)
+            now = time.time()
+            with self._lock:
+                self._db.execute(
+                    "UPDATE jobs SET lease_until = ? WHERE owner = ? AND status = 'running'",
+                    (now + self.lease, self.owner),
+                )
+                recovered = self._recover(now)
+            for job_id, priority in recovered:
+                self._push(job_id, priority)
+            if recovered:
+                async with self._ready:
+                    self._ready.notify(len(recovered))
+
+    def _recover(self, now: float) -> list:
+        """Requeue running jobs whose lease expired, or fail them after ``max_attempts``.
+
+        Returns (id, priority) of the requeued jobs. Rows written before leases
+        existed have none, so they count as expired.
+        """
+        expired = self._db.execute(
+            "SELECT id, priority, attempts FROM jobs WHERE status = 'running'"
+            " AND (lease_until IS NULL OR lease_until < ?)",
+            (now,),
+        ).fetchall()
+        still_expired = " WHERE id = ? AND status = 'running' AND (lease_until IS NULL OR lease_until < ?)"
+        recovered = []
+        for job_id, priority, attempts in expired:
+            if attempts >= self.max_attempts:
+                self._db.execute(
+                    "UPDATE jobs SET status = 'failed', error = ?, error_status = 500, finished = ?,"
+                    " owner = NULL, lease_until = NULL" + still_expired,
+                    (f"Gave up after {attempts} attempts.", now, job_id, now),
+                )
+            elif self._db.execute(
+                "UPDATE jobs SET status = 'queued', started = NULL, owner = NULL, lease_until = NULL" + still_expired,
+                (job_id, now),
+            ).rowcount:
+                recovered.append((job_id, priority))
+        return recovered
+
+    def _prune(self, now: float) -> None:
+        self._db.execute(
+            "DELETE FROM jobs WHERE status IN ('succeeded', 'failed', 'cancelled') AND finished < ?",
+            (now - self.result_ttl,),
+        )
@@ -0,0 +1,189 @@
+"""Registry of the languages the AI endpoints can parse.
+
+A language is described by a plain dict (test framework, prompt hints,
+file extensions, ...) plus a ``grammar`` reference. The tree-sitter grammar
+is only imported and built the first time the language is looked up, so a
+process that never parses JavaScript never loads its grammar.
+
+Extra languages are added by installed packages through the
+``testgenie.languages`` entry point group; the entry point name is the
+language id and it points at a spec dict (or a callable returning one):
+
+    [project.entry-points."testgenie.languages"]
+    typescript = "testgenie_typescript:SPEC"
+
+    SPEC = {
+        "grammar": "tree_sitter_typescript:language_typescript",
+        "extensions": [".ts"],
+        "test_framework": "Jest",
+        ...
+    }
+
+Specs may also list extra ``function_node_types`` and ``class_node_types``
+for grammars whose definitions use node names the built-in sets lack, and
+``definition_patterns``: regexes whose first group is a name a generated test
+block defines at its top level, so clashing names from separately generated
+blocks can be renamed when they are assembled into one file.
+"""
+
+import importlib
+import logging
+import os
+import threading
+from collections.abc import Mapping
+from importlib.metadata import entry_points
+from typing import Dict, Iterable, Optional
+
+from tree_sitter import Language
+
+from backend import slicing
+
+ENTRY_POINT_GROUP = "testgenie.languages"
+PRELOAD = os.getenv("TESTGENIE_PRELOAD", "")
+REQUIRED_KEYS = (
+    "grammar", "test_framework", "framework_hints", "test_file_suffix", "test_file_extension",
+    "block_hints", "import_pattern", "comment_prefix",
+)
+
+logger = logging.getLogger(__name__)
+
+BUILTIN_LANGUAGES = {
+    "python": {
+        "grammar": "tree_sitter_python:language",
+        "extensions": [".py"],
+        "test_framework": "pytest",
+        "framework_hints": "Prefix all test functions with test_. Use pytest.raises() for exceptions.",
+        "test_file_suffix": "_test",
+        "test_file_extension": ".py",
+        "block_hints": "Output only the imports and test functions.",
+        "import_pattern": r"(import|from)\s",
+        "comment_prefix": "#",
+        "definition_patterns": [r"^(?:async\s+)?def\s+(\w+)", r"^class\s+(\w+)"],
+    },
+    "javascript": {
+        "grammar": "tree_sitter_javascript:language",
+        "extensions": [".js", ".mjs"],
+        "test_framework": "Jest",
+        "framework_hints": "Use describe() and it() blocks. Use expect() matchers.",
+        "test_file_suffix": "",
+        "test_file_extension": ".test.js",
+        "block_hints": "Output only the imports and describe() blocks.",
+        "import_pattern": r"(import\s|(const|let|var)\s.*=\s*require\()",
+        "comment_prefix": "//",
+        "definition_patterns": [r"^(?:async\s+)?function\*?\s+(\w+)", r"^(?:const|let|var|class)\s+(\w+)"],
+    },
+    "java": {
+        "grammar": "tree_sitter_java:language",
+        "extensions": [".java"],
+        "test_framework": "JUnit 5",
+        "framework_hints": "Use @Test annotation. Use Assertions.assertEquals() and assertThrows().",
+        "test_file_suffix": "Test",
+        "test_file_extension": ".java",
+        "block_hints": "Output only the import lines and @Test methods, without an enclosing class.",
+        "import_pattern": r"(import|package)\s",
+        "comment_prefix": "//",
+        # Methods and fields of the single generated test class.
+        "definition_patterns": [
+            r"^(?:(?:public|protected|private|static|final|synchronized|transient|volatile)[ \t]+)*"
+            r"(?:<[^>]+>[ \t]+)?(?!return\b|new\b)\w[\w.<>\[\]?, ]*?[ \t]+(\w+)[ \t]*[(=;]",
+        ],
+    },
+}
+
+
+def load_grammar(grammar) -> Language:
+    """Build a Language from a ``"module:function"`` reference or a callable."""
+    if isinstance(grammar, str):
+        module_name, _, attr = grammar.partition(":")
+        grammar = getattr(importlib.import_module(module_name), attr or "language")
+    return Language(grammar())
+
+
+class LanguageRegistry(Mapping):
+    """Language id -> config dict whose ``"language"`` is built on first lookup.
+
+    Membership tests, iteration and ``spec()`` never load a grammar.
+    """
+
+    def __init__(self, specs: Optional[Dict[str, dict]] = None, group: Optional[str] = ENTRY_POINT_GROUP):
+        self._specs: Dict[str, dict] = {}
+        self._configs: Dict[str, dict] = {}
+        self._group = group
+        self._discovered = group is None
+        self._lock = threading.Lock()
+        for language_id, spec in (specs or {}).items():
+            self.register(language_id, spec)
+
+    def register(self, language_id: str, spec: dict) -> None:
+        missing = [key for key in REQUIRED_KEYS if key not in spec]
+        if missing:
+            raise ValueError(f"Language '{language_id}' is missing {missing}.")
+        slicing.FUNCTION_NODE_TYPES.update(spec.get("function_node_types", ()))
+        slicing.CLASS_NODE_TYPES.update(spec.get("class_node_types", ()))
+        with self._lock:
+            self._specs[language_id] = dict(spec)
+            self._configs.pop(language_id, None)
+
+    def _discover(self) -> None:
+        if self._discovered:
+            return
+        self._discovered = True
+        found = entry_points()
+        # Python < 3.10 returns a dict of groups instead of a selectable collection.
+        found = found.select(group=self._group) if hasattr(found, "select") else found.get(self._group, [])
+        for entry_point in found:
+            if entry_point.name in self._specs:
+                continue
+            try:
+                spec = entry_point.load()
+                self.register(entry_point.name, spec() if callable(spec) else spec)
+            except Exception:
+                logger.exception("Failed to load language plugin %s", entry_point.value)
+
+    def spec(self, language_id: str) -> dict:
+        if language_id not in self._specs:
+            self._discover()
+        return self._specs[language_id]
+
+    def __getitem__(self, language_id: str) -> dict:
+        config = self._configs.get(language_id)
+        if config is None:
+            spec = self.spec(language_id)
+            with self._lock:
+                config = self._configs.get(language_id)
+                if config is None:
+                    config = dict(spec, language=load_grammar(spec["grammar"]))
+                    self._configs[language_id] = config
+        return config
+
+    def __contains__(self, language_id) -> bool:
+        try:
+            self.spec(language_id)
+        except KeyError:
+            return False
+        return True
+
+    def __iter__(self):
+        self._discover()
+        return iter(list(self._specs))
+
+    def __len__(self) -> int:
+        self._discover()
+        return len(self._specs)
+
+    def loaded(self) -> list:
+        return list(self._configs)
+
+    def language_for_extension(self, extension: str) -> Optional[str]:
+        for language_id in self:
+            if extension in self._specs[language_id].get("extensions", ()):
+                return language_id
+        return None
+
+    def preload(self, language_ids: Optional[Iterable[str]] = None) -> None:
+        """Load grammars now, e.g. in a server master before it forks workers."""
+        for language_id in list(language_ids or self):
+            self[language_id]
+
+
+registry = LanguageRegistry(BUILTIN_LANGUAGES)
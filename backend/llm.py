@@ -0,0 +1,230 @@
+"""Async OpenAI access for the AI endpoints.
+
+Clients are pooled per (api key, base URL) so connections are reused across
+requests, upstream calls are capped by a concurrency limiter with a bounded
+wait queue, and identical in-flight prompts are coalesced into one call.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING, AsyncIterator, Dict, List, Optional, Tuple
+
+from backend.metrics import UPSTREAM_QUEUE_SECONDS, UPSTREAM_REQUESTS, UPSTREAM_TOKENS
+
+DEFAULT_MODEL = os.getenv("TESTGENIE_MODEL", "gpt-4o")
+DEFAULT_BASE_URL = os.getenv("OPENAI_BASE_URL") or None
+MAX_CONCURRENCY = int(os.getenv("TESTGENIE_LLM_CONCURRENCY", "32"))
+MAX_WAITING = int(os.getenv("TESTGENIE_LLM_MAX_WAITING", "256"))
+WAIT_TIMEOUT = float(os.getenv("TESTGENIE_LLM_WAIT_TIMEOUT", "30"))
+MAX_CLIENTS = int(os.getenv("TESTGENIE_LLM_MAX_CLIENTS", "64"))
+REQUEST_TIMEOUT = float(os.getenv("TESTGENIE_LLM_TIMEOUT", "120"))
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
+
+
+class LLMBusyError(Exception):
+    """Raised when the upstream wait queue is full or a slot wait timed out."""
+
+    def __init__(self, message: str, retry_after: int = 1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class ConcurrencyLimiter:
+    def __init__(self, limit: int, max_waiting: int, wait_timeout: float):
+        self.limit = limit
+        self.max_waiting = max_waiting
+        self.wait_timeout = wait_timeout
+        self.in_flight = 0
+        self.waiting = 0
+        self._sem = asyncio.Semaphore(limit)
+
+    @asynccontextmanager
+    async def slot(self):
+        start = time.perf_counter()
+        if self._sem.locked():
+            if self.waiting >= self.max_waiting:
+                raise LLMBusyError("Too many pending upstream requests.", retry_after=self._retry_after())
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self._sem.acquire(), self.wait_timeout)
+            except asyncio.TimeoutError:
+                raise LLMBusyError("Timed out waiting for an upstream slot.", retry_after=self._retry_after())
+            finally:
+                self.waiting -= 1
+        else:
+            await self._sem.acquire()
+        UPSTREAM_QUEUE_SECONDS.observe(time.perf_counter() - start)
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._sem.release()
+
+    def _retry_after(self) -> int:
+        return max(1, self.waiting // max(1, self.limit))
+
+
+limiter = ConcurrencyLimiter(MAX_CONCURRENCY, MAX_WAITING, WAIT_TIMEOUT)
+
+# One AsyncOpenAI per (api key, base URL); each owns a keep-alive connection pool.
+# An evicted client is closed once the last call using it has finished.
+_clients: "OrderedDict[Tuple[str, Optional[str]], AsyncOpenAI]" = OrderedDict()
+_users: Dict[int, int] = {}
+_evicted: Dict[int, "AsyncOpenAI"] = {}
+_closing = set()
+_inflight: Dict[str, "asyncio.Future[str]"] = {}
+
+
+def preload() -> None:
+    """Import the OpenAI SDK now rather than on the first upstream call."""
+    import openai  # noqa: F401
+
+
+def get_client(api_key: str, base_url: Optional[str] = None) -> "AsyncOpenAI":
+    # Imported here: the SDK alone takes about half a second to import.
+    from openai import AsyncOpenAI
+
+    key = (api_key, base_url or DEFAULT_BASE_URL)
+    client = _clients.get(key)
+    if client is not None:
+        _clients.move_to_end(key)
+        return client
+    client = AsyncOpenAI(api_key=api_key, base_url=key[1], timeout=REQUEST_TIMEOUT)
+    _clients[key] = client
+    while len(_clients) > MAX_CLIENTS:
+        _, evicted = _clients.popitem(last=False)
+        if _users.get(id(evicted)):
+            _evicted[id(evicted)] = evicted
+        else:
+            _close_soon(evicted)
+    return client
+
+
+def _close_soon(client: "AsyncOpenAI") -> None:
+    try:
+        task = asyncio.get_running_loop().create_task(client.close())
+    except RuntimeError:
+        # No event loop (e.g. a script warming the SDK); nothing was sent yet.
+        return
+    _closing.add(task)
+    task.add_done_callback(_closing.discard)
+
+
+@asynccontextmanager
+async def _client(api_key: str, base_url: Optional[str]):
+    """The pooled client for a call, kept open until the call is done even if evicted."""
+    client = get_client(api_key, base_url)
+    _users[id(client)] = _users.get(id(client), 0) + 1
+    try:
+        yield client
+    finally:
+        _users[id(client)] -= 1
+        if not _users[id(client)]:
+            del _users[id(client)]
+            if _evicted.pop(id(client), None) is not None:
+                _close_soon(client)
+
+
+async def close_clients() -> None:
+    clients = list(_clients.values()) + list(_evicted.values())
+    _clients.clear()
+    _evicted.clear()
+    for client in clients:
+        await client.close()
+    await asyncio.gather(*_closing, return_exceptions=True)
+
+
+def _request_key(api_key: str, base_url: Optional[str], params: dict) -> str:
+    blob = json.dumps([api_key, base_url or DEFAULT_BASE_URL, params], sort_keys=True)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+def _forget(key: str, task: "asyncio.Future[str]") -> None:
+    if _inflight.get(key) is task:
+        del _inflight[key]
+    # Mark the exception as retrieved even if every waiter was cancelled.
+    if not task.cancelled():
+        task.exception()
+
+
+async def complete(
+    messages: List[dict],
+    *,
+    api_key: str,
+    base_url: Optional[str] = None,
+    model: str = DEFAULT_MODEL,
+    temperature: float = 0.2,
+    max_tokens: int = 4096,
+) -> str:
+    """Return the completion text, sharing one upstream call between identical requests."""
+    params = {
+        "model": model,
+        "temperature": temperature,
+        "max_tokens": max_tokens,
+        "messages": messages,
+    }
+    key = _request_key(api_key, base_url, params)
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(_call(api_key, base_url, params))
+        _inflight[key] = task
+        task.add_done_callback(lambda t: _forget(key, t))
+    # Shield so one caller disconnecting does not cancel the shared call.
+    return await asyncio.shield(task)
+
+
+def _count_usage(usage) -> None:
+    if usage is not None:
+        UPSTREAM_TOKENS.labels("prompt").inc(usage.prompt_tokens or 0)
+        UPSTREAM_TOKENS.labels("completion").inc(usage.completion_tokens or 0)
+
+
+async def _call(api_key: str, base_url: Optional[str], params: dict) -> str:
+    async with limiter.slot(), _client(api_key, base_url) as client:
+        try:
+            response = await client.chat.completions.create(**params)
+        except Exception:
+            UPSTREAM_REQUESTS.labels("complete", "error").inc()
+            raise
+    UPSTREAM_REQUESTS.labels("complete", "ok").inc()
+    _count_usage(response.usage)
+    return response.choices[0].message.content or ""
+
+
+async def stream(
+    messages: List[dict],
+    *,
+    api_key: str,
+    base_url: Optional[str] = None,
+    model: str = DEFAULT_MODEL,
+    temperature: float = 0.2,
+    max_tokens: int = 4096,
+) -> AsyncIterator[str]:
+    """Yield completion text deltas as they arrive. Streams are never coalesced."""
+    async with limiter.slot(), _client(api_key, base_url) as client:
+        outcome = "error"
+        try:
+            response = await client.chat.completions.create(
+                model=model,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                messages=messages,
+                stream=True,
+                stream_options={"include_usage": True},
+            )
+            async for chunk in response:
+                # With include_usage the last chunk has no choices, only usage.
+                _count_usage(getattr(chunk, "usage", None))
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+            outcome = "ok"
+        finally:
+            UPSTREAM_REQUESTS.labels("stream", outcome).inc()
@@ -0,0 +1,112 @@
+"""Prometheus metrics and per-request stage timing.
+
+Code paths wrap their stages in ``stage(operation, name)``, which feeds the
+``testgenie_stage_seconds`` histogram and, during an HTTP request, the
+request's ``Server-Timing`` header. ``MetricsMiddleware`` records request
+latency per route and the number of requests in flight.
+"""
+
+import contextvars
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+# From sub-millisecond parses up to multi-minute upstream completions.
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+           1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+STAGE_SECONDS = Histogram(
+    "testgenie_stage_seconds", "Time spent per generation stage.",
+    ["operation", "stage"], buckets=BUCKETS,
+)
+REQUEST_SECONDS = Histogram(
+    "testgenie_request_seconds", "HTTP request latency, until the last body byte is sent.",
+    ["method", "route", "status"], buckets=BUCKETS,
+)
+REQUESTS_IN_FLIGHT = Gauge("testgenie_requests_in_flight", "HTTP requests being handled.")
+UPSTREAM_TOKENS = Counter(
+    "testgenie_upstream_tokens_total", "Tokens reported by the upstream model.", ["kind"],
+)
+UPSTREAM_REQUESTS = Counter(
+    "testgenie_upstream_requests_total", "Upstream completion calls.", ["mode", "outcome"],
+)
+UPSTREAM_QUEUE_SECONDS = Histogram(
+    "testgenie_upstream_queue_seconds", "Time spent waiting for an upstream concurrency slot.",
+    buckets=BUCKETS,
+)
+
+_timings: "contextvars.ContextVar[Optional[Dict[str, float]]]" = contextvars.ContextVar(
+    "testgenie_timings", default=None,
+)
+
+
+def observe(operation: str, name: str, seconds: float) -> None:
+    """Record time already measured for a stage, e.g. summed over a token stream."""
+    STAGE_SECONDS.labels(operation, name).observe(seconds)
+    timings = _timings.get()
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + seconds
+
+
+@contextmanager
+def stage(operation: str, name: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(operation, name, time.perf_counter() - start)
+
+
+def gauge(name: str, documentation: str, read) -> Gauge:
+    """A gauge whose value is read from ``read()`` at scrape time."""
+    metric = Gauge(name, documentation)
+    metric.set_function(read)
+    return metric
+
+
+def render() -> tuple:
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+def _server_timing(timings: Dict[str, float]) -> bytes:
+    return ", ".join(f"{name};dur={seconds * 1000:.2f}" for name, seconds in timings.items()).encode("latin-1")
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware, so streaming responses are timed to their last byte."""
+
+    def __init__(self, app, skip_paths=("/metrics",)):
+        self.app = app
+        self.skip_paths = set(skip_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.skip_paths:
+            await self.app(scope, receive, send)
+            return
+        timings: Dict[str, float] = {}
+        token = _timings.set(timings)
+        status = 500
+        start = time.perf_counter()
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if timings:
+                    message = dict(message, headers=list(message.get("headers", [])) + [
+                        (b"server-timing", _server_timing(timings)),
+                    ])
+            await send(message)
+
+        REQUESTS_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            REQUESTS_IN_FLIGHT.dec()
+            _timings.reset(token)
+            route = scope.get("route")
+            REQUEST_SECONDS.labels(
+                scope["method"], getattr(route, "path", "unmatched"), str(status),
+            ).observe(time.perf_counter() - start)
@@ -0,0 +1,273 @@
+"""Dependency-aware slicing of source files into prompt-sized units.
+
+Instead of sending a whole module upstream, every top-level function or
+class becomes a unit that carries only what it references: the imports it
+uses and the module-level helpers, constants and types it names. Classes
+too large for one prompt are split into their methods, each sent with a
+frame of the enclosing class (fields and constructors) and the sibling
+methods it calls. Units are then packed into batches under a token budget.
+"""
+
+import os
+import re
+import textwrap
+from typing import Dict, List
+
+from tree_sitter import Query, QueryCursor
+
+FUNCTION_NODE_TYPES = {
+    "function_definition", "function_declaration",
+    "method_declaration", "method_definition",
+}
+CLASS_NODE_TYPES = {
+    "class_definition", "class_declaration",
+}
+IMPORT_NODE_TYPES = {
+    "import_statement", "import_from_statement", "future_import_statement",
+    "import_declaration",
+}
+WRAPPER_NODE_TYPES = {"decorated_definition", "export_statement"}
+VARIABLE_NODE_TYPES = {"lexical_declaration", "variable_declaration"}
+REFERENCE_NODE_TYPES = ("identifier", "type_identifier", "property_identifier")
+CONSTRUCTOR_NAMES = {"__init__", "constructor"}
+
+PROMPT_TOKEN_BUDGET = int(os.getenv("TESTGENIE_PROMPT_TOKEN_BUDGET", "6000"))
+CONTEXT_TOKEN_BUDGET = int(os.getenv("TESTGENIE_CONTEXT_TOKEN_BUDGET", "1500"))
+BATCH_MAX_SYMBOLS = int(os.getenv("TESTGENIE_BATCH_MAX_SYMBOLS", "8"))
+
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+_BLANK_RUN_RE = re.compile(r"\n{3,}")
+_ref_queries: Dict[str, Query] = {}
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough BPE token count: one per punctuation mark, one per four word characters."""
+    return sum((len(piece) + 3) // 4 for piece in _TOKEN_RE.findall(text))
+
+
+def _ref_query(language_id: str, language) -> Query:
+    query = _ref_queries.get(language_id)
+    if query is None:
+        kinds = [k for k in REFERENCE_NODE_TYPES if language.id_for_node_kind(k, True)]
+        query = Query(language, "[" + " ".join(f"({k})" for k in kinds) + "] @ref")
+        _ref_queries[language_id] = query
+    return query
+
+
+def _unwrap(node):
+    while node.type in WRAPPER_NODE_TYPES:
+        inner = node.child_by_field_name("definition") or node.child_by_field_name("declaration")
+        if inner is None:
+            break
+        node = inner
+    return node
+
+
+def _text(node) -> str:
+    return node.text.decode("utf-8")
+
+
+def _definitions(node) -> list:
+    """(name, kind, inner node) for every name a top-level statement defines."""
+    inner = _unwrap(node)
+    if inner.type in FUNCTION_NODE_TYPES or inner.type in CLASS_NODE_TYPES:
+        name_node = inner.child_by_field_name("name")
+        if name_node is None:
+            return []
+        kind = "class" if inner.type in CLASS_NODE_TYPES else "function"
+        return [(_text(name_node), kind, inner)]
+    if inner.type == "expression_statement" and inner.named_child_count:
+        assignment = inner.named_children[0]
+        left = assignment.child_by_field_name("left") if assignment.type == "assignment" else None
+        if left is not None and left.type == "identifier":
+            return [(_text(left), "variable", inner)]
+    if inner.type in VARIABLE_NODE_TYPES:
+        found = []
+        for declarator in inner.named_children:
+            name_node = declarator.child_by_field_name("name")
+            if declarator.type == "variable_declarator" and name_node is not None and name_node.type == "identifier":
+                found.append((_text(name_node), "variable", inner))
+        return found
+    return []
+
+
+class ModuleSlicer:
+    def __init__(self, tree, language_id: str, language):
+        self.language_id = language_id
+        self.language = language
+        self._refs_cache = {}
+        self.imports = []
+        self.definitions = {}
+        self.targets = []
+        seen = set()
+        for order, child in enumerate(tree.root_node.children):
+            if child.type in IMPORT_NODE_TYPES:
+                self.imports.append({"text": _text(child), "names": self.refs(child)})
+                continue
+            for name, kind, inner in _definitions(child):
+                definition = {"name": name, "kind": kind, "node": inner, "outer": child, "order": order}
+                self.definitions.setdefault(name, definition)
+                if kind != "variable" and (kind, name) not in seen:
+                    seen.add((kind, name))
+                    self.targets.append(definition)
+
+    def refs(self, node) -> set:
+        key = (node.start_byte, node.end_byte)
+        refs = self._refs_cache.get(key)
+        if refs is None:
+            nodes = QueryCursor(_ref_query(self.language_id, self.language)).captures(node).get("ref", [])
+            refs = {_text(n) for n in nodes}
+            self._refs_cache[key] = refs
+        return refs
+
+    def slice(self, unit_token_limit: int = PROMPT_TOKEN_BUDGET // 2,
+              context_budget: int = CONTEXT_TOKEN_BUDGET) -> List[dict]:
+        """One unit per target; classes over the limit are split into their methods."""
+        units = []
+        for target in self.targets:
+            source = _text(target["outer"])
+            methods = self._methods(target) if target["kind"] == "class" else []
+            if methods and estimate_tokens(source) > unit_token_limit:
+                units.extend(self._method_units(target, methods, context_budget))
+                continue
+            refs = self.refs(target["node"])
+            units.append({
+                "type": target["kind"],
+                "name": target["name"],
+                "source": source,
+                "imports": self._imports(refs),
+                "context": self._context(refs, {target["name"]}, context_budget),
+            })
+        return units
+
+    def _methods(self, target) -> list:
+        body = target["node"].child_by_field_name("body")
+        if body is None:
+            return []
+        methods = []
+        for member in body.named_children:
+            inner = _unwrap(member)
+            name_node = inner.child_by_field_name("name")
+            if inner.type in FUNCTION_NODE_TYPES and name_node is not None:
+                methods.append((_text(name_node), inner, member))
+        return methods
+
+    def _method_units(self, target, methods, context_budget: int) -> List[dict]:
+        # Every method shares one frame (the class with fields and constructors
+        # but no other methods) so batches can send it once; sibling methods a
+        # method calls are added as their own context pieces.
+        outer = target["outer"]
+        data = outer.text
+        kept = []
+        cursor = outer.start_byte
+        for name, _, member in methods:
+            if name in CONSTRUCTOR_NAMES:
+                continue
+            kept.append(data[cursor - outer.start_byte:member.start_byte - outer.start_byte])
+            cursor = member.end_byte
+        kept.append(data[cursor - outer.start_byte:])
+        frame = "\n".join(line.rstrip() for line in b"".join(kept).decode("utf-8").split("\n"))
+        frame = _BLANK_RUN_RE.sub("\n\n", frame)
+
+        sources = {name: _dedented(member) for name, _, member in methods}
+        units = []
+        for name, inner, member in methods:
+            refs = self.refs(inner)
+            siblings = [sources[n] for n, _, _ in methods
+                        if n in refs and n != name and n not in CONSTRUCTOR_NAMES]
+            context = self._context(refs, {target["name"], name}, context_budget)
+            units.append({
+                "type": "function",
+                "name": f"{target['name']}.{name}",
+                "source": sources[name],
+                "imports": self._imports(refs),
+                "context": context + [frame] + siblings,
+            })
+        return units
+
+    def _imports(self, refs: set) -> List[str]:
+        return [imp["text"] for imp in self.imports if imp["names"] & refs]
+
+    def _context(self, refs: set, exclude: set, budget: int) -> List[str]:
+        """Module-level definitions the refs name directly, within budget.
+
+        Definitions too large to fit in full are reduced to their signature.
+        """
+        names = sorted((refs & self.definitions.keys()) - exclude, key=lambda n: self.definitions[n]["order"])
+        pieces = []
+        used = 0
+        for name in names:
+            definition = self.definitions[name]
+            text = _text(definition["outer"])
+            cost = estimate_tokens(text)
+            if used + cost > budget:
+                text = _signature(definition)
+                cost = estimate_tokens(text)
+                if used + cost > budget:
+                    continue
+            used += cost
+            pieces.append(text)
+        return pieces
+
+
+def _dedented(member) -> str:
+    return textwrap.dedent(" " * member.start_point[1] + _text(member))
+
+
+def _signature(definition) -> str:
+    outer = definition["outer"]
+    body = definition["node"].child_by_field_name("body")
+    if body is None:
+        return _text(outer)
+    header = outer.text[:body.start_byte - outer.start_byte].decode("utf-8").rstrip()
+    return header + (" { ... }" if body.text.startswith(b"{") else " ...")
+
+
+def batch_context(units: List[dict]) -> List[str]:
+    """Imports, then other context pieces, of a batch without repeats or the batch's own sources."""
+    sources = {unit["source"] for unit in units}
+    pieces = []
+    for key in ("imports", "context"):
+        for unit in units:
+            pieces.extend(p for p in unit[key] if p not in pieces and p not in sources)
+    return pieces
+
+
+def pack_batches(units: List[dict], budget: int = PROMPT_TOKEN_BUDGET,
+                 max_symbols: int = BATCH_MAX_SYMBOLS) -> List[List[int]]:
+    """Greedily group unit indexes so each batch's sources plus shared context fit the budget.
+
+    If every unit fits one prompt, they all go in one batch regardless of
+    ``max_symbols``: splitting would only repeat the shared context.
+    """
+    piece_tokens = {}
+
+    def tokens(piece: str) -> int:
+        if piece not in piece_tokens:
+            piece_tokens[piece] = estimate_tokens(piece)
+        return piece_tokens[piece]
+
+    sources = {unit["source"] for unit in units}
+    shared = {p for unit in units for p in unit["imports"] + unit["context"]} - sources
+    if sum(tokens(s) for s in sources) + sum(tokens(p) for p in shared) <= budget:
+        return [list(range(len(units)))] if units else []
+
+    batches = []
+    current = []
+    seen = set()
+    used = 0
+    for index, unit in enumerate(units):
+        pieces = set(unit["imports"]) | set(unit["context"])
+        cost = tokens(unit["source"]) + sum(tokens(p) for p in pieces - seen)
+        if current and (used + cost > budget or len(current) >= max_symbols):
+            batches.append(current)
+            current, seen = [], set()
+            cost = tokens(unit["source"]) + sum(tokens(p) for p in pieces)
+            used = 0
+        current.append(index)
+        seen |= pieces
+        seen.add(unit["source"])
+        used += cost
+    if current:
+        batches.append(current)
+    return batches
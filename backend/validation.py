@@ -0,0 +1,361 @@
+"""Validation of generated pytest files in a pool of warm worker processes.
+
+A generated file is parsed once here. A syntax error fails it without
+touching the pool; otherwise the code object compiled from that tree is sent
+to a worker, which writes it as the file's bytecode cache so pytest imports
+it without parsing again. Workers are forked from a forkserver that has
+already imported pytest, run under memory and file-size limits, are killed
+and replaced when a check exceeds its time limit, and are recycled after a
+number of checks.
+
+The limits guard the server against runaway or crashing tests; they are not
+a security sandbox for untrusted code. Collecting a file imports it and
+running it executes it, along with any code the generated test embeds, so
+only ``compile`` is enabled unless the operator lists more modes in
+``TESTGENIE_VALIDATION_MODES``.
+"""
+
+import ast
+import asyncio
+import contextlib
+import importlib.util
+import io
+import logging
+import marshal
+import multiprocessing
+import os
+import re
+import sys
+import tempfile
+import time
+from typing import Dict, Optional
+
+WORKERS = int(os.getenv("TESTGENIE_VALIDATION_WORKERS", "0")) or os.cpu_count() or 1
+TIMEOUT = float(os.getenv("TESTGENIE_VALIDATION_TIMEOUT", "10"))
+MEMORY_MB = int(os.getenv("TESTGENIE_VALIDATION_MEMORY_MB", "1024"))
+MAX_TASKS = int(os.getenv("TESTGENIE_VALIDATION_MAX_TASKS", "200"))
+# "compile" never executes anything and is always enabled.
+ENABLED_MODES = {"compile"} | {
+    mode.strip() for mode in os.getenv("TESTGENIE_VALIDATION_MODES", "compile").split(",") if mode.strip()
+}
+RESPAWN_DELAY = 0.5
+RESPAWN_MAX_DELAY = 30.0
+FILE_SIZE_BYTES = 16 * 1024 * 1024
+MAX_ERROR_CHARS = 2000
+MODES = ("compile", "collect", "run")
+# Built-in pytest plugins a one-file check does not need; unraisableexception
+# alone costs two full gc.collect() passes per run.
+DISABLED_PLUGINS = [
+    arg for name in ("cacheprovider", "unraisableexception", "threadexception", "doctest",
+                     "junitxml", "pastebin", "stepwise", "faulthandler")
+    for arg in ("-p", f"no:{name}")
+]
+
+_NAME_RE = re.compile(r"\W")
+
+logger = logging.getLogger(__name__)
+
+
+def module_filename(name: str) -> str:
+    """A safe ``*.py`` file name for a module or test file name."""
+    stem = os.path.basename(name)
+    if stem.endswith(".py"):
+        stem = stem[:-3]
+    return (_NAME_RE.sub("_", stem) or "module") + ".py"
+
+
+def _result(mode: str, started: float, **fields) -> dict:
+    result = {
+        "mode": mode,
+        "ok": False,
+        "stage": "compile",
+        "tests_collected": 0,
+        "passed": 0,
+        "failed": 0,
+        "skipped": 0,
+        "errors": [],
+    }
+    result.update(fields)
+    result["duration_ms"] = round((time.perf_counter() - started) * 1000, 2)
+    return result
+
+
+# ── Worker side ──────────────────────────────────────────────────────────────
+
+class _Collector:
+    """pytest plugin that records collection and test outcomes."""
+
+    def __init__(self):
+        self.collected = 0
+        self.passed = 0
+        self.failed = 0
+        self.skipped = 0
+        self.errors = []
+
+    def pytest_collectreport(self, report):
+        if report.failed:
+            self.errors.append(str(report.longrepr)[-MAX_ERROR_CHARS:])
+
+    def pytest_collection_finish(self, session):
+        self.collected = len(session.items)
+
+    def pytest_runtest_logreport(self, report):
+        if report.failed:
+            self.failed += 1
+            self.errors.append(f"{report.nodeid} ({report.when}): {report.longreprtext[-MAX_ERROR_CHARS:]}")
+        elif report.skipped and report.when != "teardown":
+            self.skipped += 1
+        elif report.passed and report.when == "call":
+            self.passed += 1
+
+
+def _write_bytecode(path: str, code: bytes) -> None:
+    """Write ``code`` as the timestamp-validated ``__pycache__`` entry for ``path``."""
+    stat = os.stat(path)
+    cache = importlib.util.cache_from_source(path)
+    os.makedirs(os.path.dirname(cache), exist_ok=True)
+    with open(cache, "wb") as f:
+        f.write(importlib.util.MAGIC_NUMBER)
+        f.write((0).to_bytes(4, "little"))
+        f.write((int(stat.st_mtime) & 0xFFFFFFFF).to_bytes(4, "little"))
+        f.write((stat.st_size & 0xFFFFFFFF).to_bytes(4, "little"))
+        f.write(code)
+
+
+def _run_check(mode: str, filename: str, content: str, code: bytes, modules: Dict[str, str]) -> dict:
+    import pytest
+
+    started = time.perf_counter()
+    saved_path = list(sys.path)
+    collector = _Collector()
+    with tempfile.TemporaryDirectory(prefix="testgenie-") as tmp:
+        for name, source in modules.items():
+            with open(os.path.join(tmp, name), "w", encoding="utf-8") as f:
+                f.write(source)
+        path = os.path.join(tmp, filename)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(content)
+        _write_bytecode(path, code)
+        with open(os.path.join(tmp, "pytest.ini"), "w") as f:
+            f.write("[pytest]\n")
+        args = [path, "-q", "-c", os.path.join(tmp, "pytest.ini"), "--rootdir", tmp,
+                "--noconftest", "--assert=plain"] + DISABLED_PLUGINS
+        if mode == "collect":
+            args.append("--collect-only")
+        try:
+            with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+                exit_code = pytest.main(args, plugins=[collector])
+        finally:
+            sys.path[:] = saved_path
+            # Forget the checked modules; libraries they imported stay loaded.
+            for name, module in list(sys.modules.items()):
+                if (getattr(module, "__file__", None) or "").startswith(tmp):
+                    del sys.modules[name]
+    stage = "collect" if mode == "collect" or (collector.errors and not collector.collected) else "run"
+    return _result(
+        mode, started,
+        ok=int(exit_code) in (pytest.ExitCode.OK, pytest.ExitCode.NO_TESTS_COLLECTED),
+        stage=stage,
+        tests_collected=collector.collected,
+        passed=collector.passed,
+        failed=collector.failed,
+        skipped=collector.skipped,
+        errors=collector.errors,
+    )
+
+
+def _worker_main(conn, memory_mb: int) -> None:
+    # Installed plugins would be imported and configured on every check.
+    os.environ["PYTEST_DISABLE_PLUGIN_AUTOLOAD"] = "1"
+    # Warm up pytest's lazily imported internals before taking work.
+    warmup = "def test_warmup():\n    pass\n"
+    _run_check("run", "test_warmup.py", warmup, marshal.dumps(compile(warmup, "test_warmup.py", "exec")), {})
+    try:
+        import resource
+    except ImportError:
+        resource = None
+    if resource is not None:
+        memory = memory_mb * 1024 * 1024
+        for limit, value in ((resource.RLIMIT_AS, memory), (resource.RLIMIT_FSIZE, FILE_SIZE_BYTES),
+                             (resource.RLIMIT_CORE, 0)):
+            with contextlib.suppress(ValueError, OSError):
+                resource.setrlimit(limit, (value, value))
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            return
+        try:
+            result = _run_check(*task)
+        except BaseException as e:
+            result = _result(task[0], time.perf_counter(), stage="run", errors=[f"Validation failed: {e!r}"])
+        conn.send(result)
+
+
+# ── Server side ──────────────────────────────────────────────────────────────
+
+class _Worker:
+    def __init__(self, process, conn):
+        self.process = process
+        self.conn = conn
+        self.tasks = 0
+
+
+class ValidationPool:
+    def __init__(self, workers: int = WORKERS, timeout: float = TIMEOUT,
+                 memory_mb: int = MEMORY_MB, max_tasks: int = MAX_TASKS):
+        self.workers = workers
+        self.timeout = timeout
+        self.memory_mb = memory_mb
+        self.max_tasks = max_tasks
+        if "forkserver" in multiprocessing.get_all_start_methods():
+            self._context = multiprocessing.get_context("forkserver")
+            self._context.set_forkserver_preload(["pytest", "backend.validation"])
+        else:
+            # Windows: every worker imports pytest itself, once.
+            self._context = multiprocessing.get_context("spawn")
+        self._idle: Optional[asyncio.Queue] = None
+        self._all = set()
+        self._starting: Optional[asyncio.Task] = None
+        self._respawning = set()
+        self._spawn_error: Optional[BaseException] = None
+
+    async def start(self) -> None:
+        """Fork all workers; safe to call more than once, and retried after a failure."""
+        if self._starting is None:
+            self._starting = asyncio.ensure_future(self._start())
+        starting = self._starting
+        try:
+            await asyncio.shield(starting)
+        except BaseException:
+            if starting.done() and (starting.cancelled() or starting.exception() is not None):
+                if self._starting is starting:
+                    self._starting = None
+            raise
+
+    async def _start(self) -> None:
+        self._idle = asyncio.Queue()
+        spawned = await asyncio.gather(
+            *(asyncio.to_thread(self._spawn) for _ in range(self.workers)), return_exceptions=True,
+        )
+        workers = [w for w in spawned if not isinstance(w, BaseException)]
+        errors = [e for e in spawned if isinstance(e, BaseException)]
+        if errors and not workers:
+            raise errors[0]
+        for worker in workers:
+            self._idle.put_nowait(worker)
+        for _ in errors:
+            self._respawn()
+
+    def _spawn(self) -> _Worker:
+        parent, child = self._context.Pipe()
+        process = self._context.Process(target=_worker_main, args=(child, self.memory_mb), daemon=True)
+        process.start()
+        child.close()
+        worker = _Worker(process, parent)
+        self._all.add(worker)
+        return worker
+
+    def _retire(self, worker: _Worker) -> None:
+        self._all.discard(worker)
+        worker.process.kill()
+        worker.conn.close()
+        self._respawn()
+
+    def _respawn(self) -> None:
+        """Start a replacement worker in the background, retrying until it succeeds."""
+        task = asyncio.ensure_future(self._replace())
+        self._respawning.add(task)
+        task.add_done_callback(self._respawning.discard)
+
+    async def _replace(self) -> None:
+        delay = RESPAWN_DELAY
+        while True:
+            try:
+                worker = await asyncio.to_thread(self._spawn)
+            except Exception as e:
+                self._spawn_error = e
+                logger.exception("Failed to start a validation worker; retrying in %gs", delay)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, RESPAWN_MAX_DELAY)
+                continue
+            self._spawn_error = None
+            self._idle.put_nowait(worker)
+            return
+
+    async def _acquire(self) -> Optional[_Worker]:
+        """An idle worker, or None while no worker is alive and replacements keep failing."""
+        while True:
+            if not self._all and self._spawn_error is not None:
+                return None
+            try:
+                return await asyncio.wait_for(self._idle.get(), 1.0)
+            except asyncio.TimeoutError:
+                continue
+
+    def _roundtrip(self, worker: _Worker, task: tuple) -> dict:
+        worker.conn.send(task)
+        if not worker.conn.poll(self.timeout):
+            raise TimeoutError
+        return worker.conn.recv()
+
+    async def check(self, mode: str, filename: str, content: str, code: bytes,
+                    modules: Dict[str, str]) -> dict:
+        await self.start()
+        started = time.perf_counter()
+        worker = await self._acquire()
+        if worker is None:
+            return _result(mode, started, stage="run",
+                           errors=[f"Validation workers could not be started: {self._spawn_error!r}"])
+        healthy = False
+        try:
+            result = await asyncio.to_thread(self._roundtrip, worker, (mode, filename, content, code, modules))
+            healthy = True
+        except TimeoutError:
+            result = _result(mode, started, stage="run", errors=[f"Timed out after {self.timeout:g}s."])
+        except (EOFError, OSError) as e:
+            result = _result(mode, started, stage="run", errors=[f"Validation worker crashed: {e!r}"])
+        finally:
+            # A worker that timed out, crashed or was abandoned by a cancelled
+            # request may still be busy, so it is replaced rather than reused.
+            worker.tasks += 1
+            if healthy and worker.tasks < self.max_tasks:
+                self._idle.put_nowait(worker)
+            else:
+                self._retire(worker)
+        return result
+
+    def close(self) -> None:
+        for task in list(self._respawning):
+            task.cancel()
+        for worker in list(self._all):
+            worker.process.kill()
+            worker.conn.close()
+        self._all.clear()
+
+
+pool = ValidationPool()
+
+
+async def validate_test_file(content: str, filename: str, mode: str,
+                             modules: Optional[Dict[str, str]] = None) -> dict:
+    """Compile ``content`` and, unless ``mode`` is "compile", collect or run it with pytest.
+
+    ``modules`` maps extra file names (such as the module under test) to
+    their source, written next to the test file.
+    """
+    started = time.perf_counter()
+    filename = module_filename(filename)
+    if mode not in ENABLED_MODES:
+        return _result(mode, started, stage=mode, errors=[f"Validation mode '{mode}' is disabled on this server."])
+    try:
+        tree = ast.parse(content, filename)
+        code = compile(tree, filename, "exec")
+    except (SyntaxError, ValueError) as e:
+        line = f"line {e.lineno}: " if getattr(e, "lineno", None) else ""
+        return _result(mode, started, errors=[f"{line}{getattr(e, 'msg', None) or e}"])
+    if mode == "compile":
+        tests = [n.name for n in tree.body
+                 if isinstance(n, (ast.FunctionDef, ast.AsyncFunctionDef)) and n.name.startswith("test")]
+        return _result(mode, started, ok=True, tests_collected=len(tests))
+    return await pool.check(mode, filename, content, marshal.dumps(code), modules or {})
@@ -0,0 +1,103 @@
+"""Synthetic Python, JavaScript and Java sources of a given size.
+
+Modules mix imports, constants, helpers that call each other, and classes
+with fields and methods, so slicing and symbol extraction see realistic
+dependency structure. JavaScript and Java sources stop at the first whole
+definition past the requested line count so they always parse cleanly.
+"""
+
+import random
+
+
+def python_module(lines: int, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    out = ["import os", "import json", "from collections import OrderedDict", "", "LIMIT = 100", ""]
+    i = 0
+    while len(out) < lines:
+        helper = f"helper_{rng.randrange(i)}" if i else "abs"
+        out += [
+            f"def helper_{i}(value):",
+            f"    total = {helper}(value) + LIMIT",
+            f"    return os.path.join(str(total), '{i}')",
+            "",
+            f"class Widget{i}:",
+            f"    scale = {i}",
+            "",
+            "    def __init__(self, name):",
+            "        self.name = name",
+            "        self.items = OrderedDict()",
+            "",
+            "    def add(self, key, value):",
+            f"        self.items[key] = helper_{i}(value) * self.scale",
+            "        return self.render()",
+            "",
+            "    def render(self):",
+            "        return json.dumps(self.items)",
+            "",
+        ]
+        i += 1
+    return "\n".join(out[:lines]) + "\n"
+
+
+def javascript_module(lines: int, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    out = ["const path = require('path');", "import { format } from './format';", "", "const LIMIT = 100;", ""]
+    i = 0
+    while len(out) < lines:
+        helper = f"helper{rng.randrange(i)}" if i else "Math.abs"
+        out += [
+            f"function helper{i}(value) {{",
+            f"  const total = {helper}(value) + LIMIT;",
+            f"  return path.join(String(total), '{i}');",
+            "}",
+            "",
+            f"class Widget{i} {{",
+            "  constructor(name) {",
+            "    this.name = name;",
+            "    this.items = new Map();",
+            "  }",
+            "",
+            "  add(key, value) {",
+            f"    this.items.set(key, helper{i}(value));",
+            "    return this.render();",
+            "  }",
+            "",
+            "  render() {",
+            "    return format(this.items);",
+            "  }",
+            "}",
+            "",
+        ]
+        i += 1
+    return "\n".join(out) + "\n"
+
+
+def java_module(lines: int, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    out = ["package demo;", "", "import java.util.HashMap;", "import java.util.Map;", "",
+           "public class Service {", "    private static final int LIMIT = 100;",
+           "    private final Map<String, Integer> items = new HashMap<>();", ""]
+    i = 0
+    while len(out) < lines:
+        helper = f"helper{rng.randrange(i)}" if i else "Math.abs"
+        out += [
+            f"    int helper{i}(int value) {{",
+            f"        int total = {helper}(value) + LIMIT;",
+            "        return total * 2;",
+            "    }",
+            "",
+            f"    String add{i}(String key, int value) {{",
+            f"        items.put(key, helper{i}(value));",
+            "        return items.toString();",
+            "    }",
+            "",
+        ]
+        i += 1
+    return "\n".join(out + ["}"]) + "\n"
+
+
+GENERATORS = {
+    "python": python_module,
+    "javascript": javascript_module,
+    "java": java_module,
+}
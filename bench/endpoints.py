@@ -0,0 +1,221 @@
+"""Latency and throughput of every generation endpoint on synthetic corpora.
+
+By default the stub upstream and the backend are started as subprocesses
+on free ports with caching disabled and fixed settings, so runs are
+comparable between commits:
+
+    python -m bench.endpoints --sizes 100,1000,5000 --json results.json
+    python -m bench.endpoints --baseline results.json
+
+Pass ``--url`` to measure an already running backend instead. Each request
+uses a differently seeded source so neither the block cache nor request
+coalescing hides work. After the run the mean time per stage is read back
+from the backend's /metrics.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+
+import httpx
+from prometheus_client.parser import text_string_to_metric_families
+
+from bench.corpus import GENERATORS
+
+# endpoint -> (path, languages it accepts)
+ENDPOINTS = {
+    "generate": ("/generate", ["python"]),
+    "generate_ai": ("/generate/ai", ["python", "javascript", "java"]),
+    "generate_ai_stream": ("/generate/ai/stream", ["python", "javascript", "java"]),
+    "sessions": ("/sessions", ["python", "javascript", "java"]),
+}
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_until_up(url: str, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    raise RuntimeError(f"{url} did not come up")
+
+
+@contextmanager
+def local_servers(stub_delay: float):
+    """Start the stub upstream and the backend; yield the backend URL."""
+    stub_port, app_port = _free_port(), _free_port()
+    env = dict(
+        os.environ,
+        STUB_LLM_DELAY=str(stub_delay),
+        STUB_LLM_TOKEN_DELAY="0",
+        OPENAI_BASE_URL=f"http://127.0.0.1:{stub_port}/v1",
+        OPENAI_API_KEY="stub",
+        TESTGENIE_CACHE_PATH="",
+        TESTGENIE_CACHE_MEMORY_ENTRIES="0",
+        TESTGENIE_JOB_PATH="",
+    )
+    uvicorn = [sys.executable, "-m", "uvicorn", "--log-level", "warning", "--host", "127.0.0.1"]
+    processes = [
+        subprocess.Popen(uvicorn + ["bench.stub_llm:app", "--port", str(stub_port)], env=env),
+        subprocess.Popen(uvicorn + ["backend.app:app", "--port", str(app_port)], env=env),
+    ]
+    try:
+        _wait_until_up(f"http://127.0.0.1:{stub_port}/stats")
+        _wait_until_up(f"http://127.0.0.1:{app_port}/health")
+        yield f"http://127.0.0.1:{app_port}"
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+
+
+def _body(endpoint: str, language: str, source: str) -> dict:
+    if endpoint == "generate":
+        return {"source": source}
+    return {"source": source, "language": language}
+
+
+async def measure(http: httpx.AsyncClient, url: str, endpoint: str, sources, language: str,
+                  concurrency: int) -> dict:
+    path = ENDPOINTS[endpoint][0]
+    latencies = []
+    failures = 0
+    pending = iter(sources)
+
+    async def worker():
+        nonlocal failures
+        for source in pending:
+            start = time.perf_counter()
+            if endpoint == "generate_ai_stream":
+                async with http.stream("POST", url + path, json=_body(endpoint, language, source)) as resp:
+                    body = b"".join([chunk async for chunk in resp.aiter_bytes()])
+                ok = resp.status_code == 200 and b"event: done" in body
+            else:
+                resp = await http.post(url + path, json=_body(endpoint, language, source))
+                ok = resp.status_code == 200
+                if ok and endpoint == "sessions":
+                    await http.delete(f"{url}/sessions/{resp.json()['session_id']}")
+            latencies.append(time.perf_counter() - start)
+            failures += not ok
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "failed": failures,
+        "rps": len(latencies) / elapsed,
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p99_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000,
+    }
+
+
+def stage_means(metrics_text: str) -> dict:
+    sums, counts = {}, {}
+    for family in text_string_to_metric_families(metrics_text):
+        if family.name != "testgenie_stage_seconds":
+            continue
+        for sample in family.samples:
+            key = (sample.labels.get("operation"), sample.labels.get("stage"))
+            if sample.name.endswith("_sum"):
+                sums[key] = sample.value
+            elif sample.name.endswith("_count"):
+                counts[key] = sample.value
+    return {key: sums[key] / counts[key] * 1000 for key in sums if counts.get(key)}
+
+
+async def run(url: str, endpoints, languages, sizes, requests: int, concurrency: int) -> list:
+    results = []
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(timeout=600, limits=limits) as http:
+        for endpoint in endpoints:
+            for language in languages:
+                if language not in ENDPOINTS[endpoint][1]:
+                    continue
+                for lines in sizes:
+                    sources = [GENERATORS[language](lines, seed=i) for i in range(requests)]
+                    # One untimed request warms parsers, queries and connections.
+                    await measure(http, url, endpoint, sources[:1], language, 1)
+                    result = await measure(http, url, endpoint, sources, language, concurrency)
+                    result.update(endpoint=endpoint, language=language, lines=lines)
+                    results.append(result)
+                    print(_row(result), flush=True)
+        stages = stage_means((await http.get(url + "/metrics")).text)
+    print()
+    print(f"{'operation':<14}{'stage':<14}{'mean ms':>10}")
+    for (operation, name), mean in sorted(stages.items()):
+        print(f"{operation:<14}{name:<14}{mean:>10.2f}")
+    return results
+
+
+def _row(result: dict, baseline: dict = None) -> str:
+    row = (f"{result['endpoint']:<20}{result['language']:<12}{result['lines']:>7}"
+           f"{result['requests']:>6}{result['failed']:>6}{result['rps']:>9.1f}"
+           f"{result['p50_ms']:>10.1f}{result['p99_ms']:>10.1f}")
+    if baseline:
+        row += "".join(
+            f"{(result[k] - baseline[k]) / baseline[k] * 100:>+9.0f}%" for k in ("rps", "p50_ms", "p99_ms")
+        )
+    return row
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default=None, help="benchmark a running backend instead of starting one")
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS))
+    parser.add_argument("--languages", default="python,javascript,java")
+    parser.add_argument("--sizes", default="100,1000,5000")
+    parser.add_argument("--requests", type=int, default=50, help="requests per endpoint, language and size")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--stub-delay", type=float, default=0.05, help="stub time to first token, in seconds")
+    parser.add_argument("--json", default=None, help="write results to this file")
+    parser.add_argument("--baseline", default=None, help="compare with results written by --json")
+    args = parser.parse_args()
+
+    endpoints = args.endpoints.split(",")
+    languages = args.languages.split(",")
+    sizes = [int(n) for n in args.sizes.split(",")]
+    print(f"{'endpoint':<20}{'language':<12}{'lines':>7}{'reqs':>6}{'fail':>6}"
+          f"{'req/s':>9}{'p50 ms':>10}{'p99 ms':>10}")
+
+    def go(url):
+        return asyncio.run(run(url, endpoints, languages, sizes, args.requests, args.concurrency))
+
+    if args.url:
+        results = go(args.url)
+    else:
+        with local_servers(args.stub_delay) as url:
+            results = go(url)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = {(r["endpoint"], r["language"], r["lines"]): r for r in json.load(f)}
+        print()
+        print("change versus baseline (req/s, p50, p99):")
+        for result in results:
+            before = baseline.get((result["endpoint"], result["language"], result["lines"]))
+            if before:
+                print(_row(result, before))
+
+
+if __name__ == "__main__":
+    main()
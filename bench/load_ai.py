@@ -0,0 +1,66 @@
+"""Concurrent load test for /generate/ai.
+
+Start the stub upstream and the backend first:
+
+    uvicorn bench.stub_llm:app --port 9000
+    OPENAI_BASE_URL=http://localhost:9000/v1 uvicorn backend.app:app --port 8000
+
+then run:
+
+    python -m bench.load_ai --clients 100 --requests 1000
+"""
+
+import argparse
+import asyncio
+import time
+
+import httpx
+
+SOURCE = '''
+def add(a, b):
+    return a + b
+
+
+class Calculator:
+    def mul(self, a, b):
+        return a * b
+'''
+
+
+async def run(url: str, clients: int, total: int, unique: bool) -> None:
+    latencies = []
+    statuses = {}
+    counter = iter(range(total))
+
+    async def worker(http: httpx.AsyncClient):
+        for i in counter:
+            source = SOURCE + (f"\n# variant {i}\n" if unique else "")
+            start = time.perf_counter()
+            resp = await http.post(url, json={"source": source, "language": "python", "api_key": "stub"})
+            latencies.append(time.perf_counter() - start)
+            statuses[resp.status_code] = statuses.get(resp.status_code, 0) + 1
+
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+    async with httpx.AsyncClient(timeout=300, limits=limits) as http:
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(http) for _ in range(clients)))
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    print(f"requests:   {len(latencies)} in {elapsed:.2f}s ({len(latencies) / elapsed:.1f} req/s)")
+    print(f"statuses:   {statuses}")
+    print(f"p50 / p99:  {latencies[len(latencies) // 2]:.3f}s / {latencies[int(len(latencies) * 0.99) - 1]:.3f}s")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://localhost:8000/generate/ai")
+    parser.add_argument("--clients", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--unique", action="store_true", help="make every prompt distinct (disables coalescing)")
+    args = parser.parse_args()
+    asyncio.run(run(args.url, args.clients, args.requests, args.unique))
+
+
+if __name__ == "__main__":
+    main()
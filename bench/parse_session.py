@@ -0,0 +1,73 @@
+"""Compare full re-parses with incremental session edits on a large file.
+
+    python -m bench.parse_session --lines 10000 --edits 200
+"""
+
+import argparse
+import random
+import time
+
+from backend.app import (
+    ContentChange, ParseSession, TextPosition, TextRange, parse_source_ai, symbols_from_tree,
+)
+
+
+def synthetic_python(lines: int) -> str:
+    out = []
+    i = 0
+    while len(out) < lines:
+        out += [
+            f"class Widget{i}:",
+            f"    def method_{i}(self, value):",
+            f"        total = value * {i}",
+            f"        return total + {i}",
+            "",
+            f"def helper_{i}(a, b):",
+            f"    if a > b:",
+            f"        return a - b",
+            f"    return b - a",
+            "",
+        ]
+        i += 1
+    return "\n".join(out[:lines]) + "\n"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--lines", type=int, default=10000)
+    parser.add_argument("--edits", type=int, default=200)
+    args = parser.parse_args()
+
+    source = synthetic_python(args.lines)
+    rng = random.Random(0)
+
+    start = time.perf_counter()
+    for _ in range(args.edits):
+        symbols_from_tree(parse_source_ai(source, "python"), "python", with_source=False)
+    full = (time.perf_counter() - start) / args.edits
+
+    session = ParseSession("python", source, 0)
+    lines = source.split("\n")
+    start = time.perf_counter()
+    for _ in range(args.edits):
+        # Type a character just before the end of a non-empty line, like
+        # growing an identifier or a literal.
+        line = rng.randrange(len(lines) - 1)
+        while not lines[line]:
+            line = rng.randrange(len(lines) - 1)
+        column = len(lines[line]) - 1
+        pos = TextPosition(line=line, character=column)
+        session.apply([ContentChange(range=TextRange(start=pos, end=pos), text="1")])
+        lines[line] = lines[line][:column] + "1" + lines[line][column:]
+        session.symbols()
+    incremental = (time.perf_counter() - start) / args.edits
+
+    assert session.symbols() == symbols_from_tree(parse_source_ai("\n".join(lines), "python"), "python", with_source=False), \
+        "incremental symbols diverged"
+    print(f"{args.lines} lines, {args.edits} edits")
+    print(f"full parse + extract:        {full * 1000:.2f} ms/edit")
+    print(f"incremental parse + extract: {incremental * 1000:.2f} ms/edit")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""Prompt tokens and wall time: whole-file prompts versus sliced batches.
+
+Reports total prompt tokens for a cold run, the largest single prompt
+(before/after), and the tokens sent after editing one symbol with a warm
+cache. Token counts need nothing else running. For wall time, start the
+stub upstream (its latency grows with prompt size) and pass its URL:
+
+    uvicorn bench.stub_llm:app --port 9000
+    python -m bench.slicing --base-url http://localhost:9000/v1
+"""
+
+import argparse
+import asyncio
+import time
+
+import backend.app as backend_app
+from backend import llm
+from backend.app import (
+    AI_FILE_PROMPT, AI_LANGUAGES, AIGenerateRequest, _plan_ai_generation, extract_symbols_ai, gather_bounded,
+)
+from backend.cache import BlockCache
+from backend.slicing import estimate_tokens
+from bench.corpus import GENERATORS
+
+
+def whole_file_prompt(source: str, language: str) -> str:
+    symbols = extract_symbols_ai(source, language)
+    functions = "\n".join(f"  - {s['name']}" for s in symbols if s["type"] == "function")
+    classes = "\n".join(f"  - {s['name']}" for s in symbols if s["type"] == "class")
+    return AI_FILE_PROMPT.format(
+        test_framework=AI_LANGUAGES[language]["test_framework"],
+        language=language,
+        symbol_section=f"Functions to test:\n{functions}\nClasses to test:\n{classes}\n",
+        framework_hints=AI_LANGUAGES[language]["framework_hints"],
+        source=source,
+    )
+
+
+async def timed_calls(prompts, base_url: str) -> float:
+    start = time.perf_counter()
+    results = await gather_bounded(
+        llm.complete([{"role": "user", "content": p}], api_key="bench", base_url=base_url)
+        for p in prompts
+    )
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+    return time.perf_counter() - start
+
+
+async def run(languages, sizes, base_url) -> None:
+    print(f"{'language':<11}{'lines':>7}{'before tok':>12}{'after tok':>11}{'max prompt':>18}{'edit tok':>10}"
+          f"{'batches':>9}{'plan ms':>9}{'before s':>10}{'after s':>9}")
+    for language in languages:
+        for size in sizes:
+            source = GENERATORS[language](size)
+            before = whole_file_prompt(source, language)
+
+            # Cold cache: every unit is planned upstream.
+            backend_app.block_cache = BlockCache(memory_entries=1_000_000, path=None)
+            payload = AIGenerateRequest(source=source, language=language, filename="module", api_key="bench")
+            start = time.perf_counter()
+            plan = _plan_ai_generation(payload)
+            plan_ms = (time.perf_counter() - start) * 1000
+            prompts = [job["prompt"] for job in plan["jobs"]]
+            after_tokens = [estimate_tokens(p) for p in prompts]
+
+            # Warm cache, then edit one unit the way a save would.
+            for job in plan["jobs"]:
+                for key in job["keys"]:
+                    backend_app.block_cache.put(key, "")
+            unit = plan["units"][len(plan["units"]) // 2]["source"]
+            at = source.index("value", source.index(unit.splitlines()[0].strip()))
+            payload.source = source[:at] + "amount" + source[at + len("value"):]
+            edit_tokens = sum(estimate_tokens(job["prompt"]) for job in _plan_ai_generation(payload)["jobs"])
+
+            before_s = after_s = float("nan")
+            if base_url:
+                before_s = await timed_calls([before], base_url)
+                after_s = await timed_calls(prompts, base_url)
+            max_prompt = f"{estimate_tokens(before)}/{max(after_tokens)}"
+            print(f"{language:<11}{size:>7}{estimate_tokens(before):>12}{sum(after_tokens):>11}{max_prompt:>18}"
+                  f"{edit_tokens:>10}{len(prompts):>9}{plan_ms:>9.0f}{before_s:>10.2f}{after_s:>9.2f}")
+    await llm.close_clients()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--languages", default="python,javascript,java")
+    parser.add_argument("--sizes", default="1000,5000,10000,20000")
+    parser.add_argument("--base-url", default=None, help="OpenAI-compatible stub to time upstream calls against")
+    args = parser.parse_args()
+    asyncio.run(run(args.languages.split(","), [int(s) for s in args.sizes.split(",")], args.base_url))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""Cold-start time and memory of the backend, lazy versus preloaded.
+
+Every measurement runs in a fresh interpreter:
+
+- import: time to ``import backend.app`` and the resulting RSS, with
+  grammars loaded lazily and with ``TESTGENIE_PRELOAD=all``;
+- first use: time of the first parse in each language after a lazy import;
+- forked workers: a master imports the app (lazily or preloaded), forks
+  ``--workers`` children that each parse every language and create an
+  OpenAI client, and reports each child's private memory (pages not shared
+  with the master), which is what every extra worker costs.
+
+    python -m bench.startup --runs 5 --workers 4
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+IMPORT = r"""
+import json, time
+start = time.perf_counter()
+import backend.app
+elapsed = time.perf_counter() - start
+rss = next(int(l.split()[1]) for l in open("/proc/self/status") if l.startswith("VmRSS"))
+print(json.dumps({"seconds": elapsed, "rss_kb": rss}))
+"""
+
+FIRST_USE = r"""
+import json, time
+import backend.app as app
+timings = {}
+for language_id in ("python", "javascript", "java"):
+    start = time.perf_counter()
+    app.extract_symbols_ai("x = 1\n", language_id)
+    timings[language_id] = time.perf_counter() - start
+start = time.perf_counter()
+app.llm.get_client("stub")
+timings["openai client"] = time.perf_counter() - start
+print(json.dumps(timings))
+"""
+
+FORKED = r"""
+import json, os, sys
+import backend.app as app
+workers = int(sys.argv[1])
+children = []
+for _ in range(workers):
+    read, write = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read)
+        for language_id in ("python", "javascript", "java"):
+            app.extract_symbols_ai("def f():\n    pass\n", language_id)
+        app.llm.get_client("stub")
+        fields = {}
+        for line in open("/proc/self/smaps_rollup"):
+            parts = line.split()
+            if parts[0] in ("Rss:", "Pss:", "Private_Clean:", "Private_Dirty:"):
+                fields[parts[0].rstrip(":")] = int(parts[1])
+        os.write(write, json.dumps(fields).encode())
+        os._exit(0)
+    os.close(write)
+    children.append((pid, read))
+results = []
+for pid, read in children:
+    data = b""
+    while chunk := os.read(read, 65536):
+        data += chunk
+    os.waitpid(pid, 0)
+    results.append(json.loads(data))
+print(json.dumps(results))
+"""
+
+
+def python(code: str, env: dict, *args) -> object:
+    out = subprocess.run([sys.executable, "-c", code, *args], env=env, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    base = dict(os.environ, TESTGENIE_CACHE_PATH="", TESTGENIE_JOB_PATH="")
+    base.pop("TESTGENIE_PRELOAD", None)
+    modes = {"lazy": base, "preload=all": dict(base, TESTGENIE_PRELOAD="all")}
+
+    print(f"{'import':<14}{'median ms':>11}{'min ms':>9}{'RSS MB':>9}")
+    for name, env in modes.items():
+        runs = [python(IMPORT, env) for _ in range(args.runs)]
+        seconds = [r["seconds"] for r in runs]
+        print(f"{name:<14}{statistics.median(seconds) * 1000:>11.0f}{min(seconds) * 1000:>9.0f}"
+              f"{statistics.median(r['rss_kb'] for r in runs) / 1024:>9.1f}")
+
+    print()
+    print("first use after a lazy import (ms):")
+    for what, seconds in python(FIRST_USE, base).items():
+        print(f"  {what:<14}{seconds * 1000:>8.1f}")
+
+    print()
+    print(f"{args.workers} forked workers, per worker (MB):")
+    print(f"{'master':<14}{'RSS':>8}{'PSS':>8}{'private':>9}")
+    for name, env in modes.items():
+        children = python(FORKED, env, str(args.workers))
+        rss = statistics.mean(c["Rss"] for c in children) / 1024
+        pss = statistics.mean(c["Pss"] for c in children) / 1024
+        private = statistics.mean(c["Private_Clean"] + c["Private_Dirty"] for c in children) / 1024
+        print(f"{name:<14}{rss:>8.1f}{pss:>8.1f}{private:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
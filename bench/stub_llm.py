@@ -0,0 +1,98 @@
+"""Minimal OpenAI-compatible chat completions server for local load tests.
+
+Run with:
+
+    STUB_LLM_DELAY=1.0 uvicorn bench.stub_llm:app --port 9000
+
+and point the backend at it with OPENAI_BASE_URL=http://localhost:9000/v1.
+"""
+
+import asyncio
+import json
+import os
+import re
+import time
+
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+DELAY = float(os.getenv("STUB_LLM_DELAY", "0.5"))
+TOKEN_DELAY = float(os.getenv("STUB_LLM_TOKEN_DELAY", "0.01"))
+# Extra latency per 1k prompt tokens, to model prefill cost.
+PREFILL_DELAY = float(os.getenv("STUB_LLM_PREFILL_DELAY", "0.05"))
+REPLY = os.getenv(
+    "STUB_LLM_REPLY",
+    "```python\nimport pytest\n\n\ndef test_stub():\n    assert True\n```",
+)
+
+app = FastAPI(title="TestGenie stub LLM")
+stats = {"requests": 0, "prompt_tokens": 0}
+
+_NAMES_RE = re.compile(r"from the module `[^`]*`: (.*)\.\n")
+_MARKER_RE = re.compile(r"exactly `(.+?) <symbol name>`")
+
+
+def _reply(prompt: str) -> str:
+    """Echo one canned section per requested symbol so batch splitting works."""
+    names = _NAMES_RE.search(prompt)
+    marker = _MARKER_RE.search(prompt)
+    if not names or not marker:
+        return REPLY
+    return "\n\n".join(f"{marker.group(1)} {name}\n{REPLY}" for name in names.group(1).split(", "))
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    stats["requests"] += 1
+    prompt = "\n".join(m.get("content", "") for m in body.get("messages", []))
+    prompt_tokens = len(prompt) // 4
+    stats["prompt_tokens"] += prompt_tokens
+    reply = _reply(prompt)
+    if body.get("stream"):
+        return StreamingResponse(_stream(body, reply, prompt_tokens), media_type="text/event-stream")
+    await asyncio.sleep(DELAY + PREFILL_DELAY * prompt_tokens / 1000)
+    completion_tokens = len(reply) // 4
+    return {
+        "id": f"chatcmpl-stub-{stats['requests']}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "stub"),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": reply},
+            "finish_reason": "stop",
+        }],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        },
+    }
+
+
+async def _stream(body: dict, reply: str, prompt_tokens: int):
+    # DELAY is the time to first token; the reply then trickles out in small chunks.
+    await asyncio.sleep(DELAY + PREFILL_DELAY * prompt_tokens / 1000)
+    base = {"id": f"chatcmpl-stub-{stats['requests']}", "object": "chat.completion.chunk",
+            "created": int(time.time()), "model": body.get("model", "stub")}
+    for i in range(0, len(reply), 4):
+        chunk = dict(base, choices=[{"index": 0, "delta": {"content": reply[i:i + 4]}, "finish_reason": None}])
+        yield f"data: {json.dumps(chunk)}\n\n"
+        await asyncio.sleep(TOKEN_DELAY)
+    chunk = dict(base, choices=[{"index": 0, "delta": {}, "finish_reason": "stop"}])
+    yield f"data: {json.dumps(chunk)}\n\n"
+    if (body.get("stream_options") or {}).get("include_usage"):
+        completion_tokens = len(reply) // 4
+        chunk = dict(base, choices=[], usage={
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        })
+        yield f"data: {json.dumps(chunk)}\n\n"
+    yield "data: [DONE]\n\n"
+
+
+@app.get("/stats")
+async def get_stats():
+    return stats
@@ -0,0 +1,63 @@
+"""Validations per minute of the warm pytest worker pool.
+
+Runs generated-style test files (half of them with a failing test) through
+each validation mode concurrently and reports throughput and latency:
+
+    python -m bench.validation --files 500 --workers 4
+"""
+
+import argparse
+import asyncio
+import time
+
+from backend import validation
+
+MODULE = "def add(a, b):\n    return a + b\n"
+TESTS = '''import pytest
+from source import add
+
+
+def test_add_{i}():
+    assert add({i}, 1) == {expected}
+
+
+@pytest.mark.parametrize("a, b", [(1, 2), (3, 4)])
+def test_add_pairs_{i}(a, b):
+    assert add(a, b) == a + b
+'''
+
+
+async def run(files: int, workers: int, modes) -> None:
+    # The benchmark's own files are trusted, so every mode is enabled here.
+    validation.ENABLED_MODES = set(validation.MODES)
+    validation.pool = validation.ValidationPool(workers=workers)
+    start = time.perf_counter()
+    await validation.pool.start()
+    print(f"pool of {workers} workers ready in {time.perf_counter() - start:.2f}s")
+    print(f"{'mode':<10}{'files':>7}{'ok':>6}{'per min':>10}{'p50 ms':>9}{'p99 ms':>9}")
+    try:
+        for mode in modes:
+            contents = [TESTS.format(i=i, expected=i + 1 if i % 2 else i) for i in range(files)]
+            start = time.perf_counter()
+            results = await asyncio.gather(*(
+                validation.validate_test_file(c, "source_test.py", mode, {"source.py": MODULE}) for c in contents
+            ))
+            elapsed = time.perf_counter() - start
+            latencies = sorted(r["duration_ms"] for r in results)
+            print(f"{mode:<10}{files:>7}{sum(bool(r['ok']) for r in results):>6}{files / elapsed * 60:>10.0f}"
+                  f"{latencies[len(latencies) // 2]:>9.1f}{latencies[int(len(latencies) * 0.99) - 1]:>9.1f}")
+    finally:
+        validation.pool.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=500)
+    parser.add_argument("--workers", type=int, default=validation.WORKERS)
+    parser.add_argument("--modes", default="compile,collect,run")
+    args = parser.parse_args()
+    asyncio.run(run(args.files, args.workers, args.modes.split(",")))
+
+
+if __name__ == "__main__":
+    main()
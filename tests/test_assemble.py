@@ -0,0 +1,49 @@
+import ast
+
+from backend.app import assemble_test_file
+
+PY_BLOCK = "import pytest\n\n\ndef test_stub():\n    assert True\n"
+
+
+def test_python_duplicate_tests_are_renamed():
+    content = assemble_test_file([PY_BLOCK] * 3, "python", "source_test")
+    names = [n.name for n in ast.parse(content).body if isinstance(n, ast.FunctionDef)]
+    assert names == ["test_stub", "test_stub_2", "test_stub_3"]
+    assert content.count("import pytest") == 1
+
+
+def test_python_renames_references_within_the_block():
+    first = "import pytest\n\n@pytest.fixture\ndef calc():\n    return 1\n\ndef test_calc(calc):\n    assert calc\n"
+    content = assemble_test_file([first, first], "python", "source_test")
+    tree = ast.parse(content)
+    functions = {n.name: n for n in tree.body if isinstance(n, ast.FunctionDef)}
+    assert set(functions) == {"calc", "test_calc", "calc_2", "test_calc_2"}
+    assert [a.arg for a in functions["test_calc_2"].args.args] == ["calc_2"]
+
+
+def test_distinct_names_are_left_alone():
+    blocks = ["def test_a():\n    pass\n", "def test_b():\n    pass\n"]
+    assert assemble_test_file(blocks, "python", "x") == "def test_a():\n    pass\n\n\ndef test_b():\n    pass\n"
+
+
+def test_java_methods_and_fields_are_unique_in_the_class():
+    block = (
+        "import org.junit.jupiter.api.Test;\n\n"
+        "private Calculator calc = new Calculator();\n\n"
+        "@BeforeEach\nvoid setUp() {\n    calc.reset();\n}\n\n"
+        "@Test\npublic void testAdd() throws Exception {\n    assertEquals(2, calc.add(1, 1));\n}\n"
+    )
+    content = assemble_test_file([block, block], "java", "CalculatorTest")
+    assert content.startswith("import org.junit.jupiter.api.Test;\n\n\nclass CalculatorTest {\n")
+    for name in ("calc", "setUp", "testAdd"):
+        assert content.count(f" {name}(") + content.count(f" {name} =") == 1
+        assert content.count(f" {name}_2(") + content.count(f" {name}_2 =") == 1
+    # Calls inside method bodies are not definitions.
+    assert "assertEquals(" in content and "assertEquals_2" not in content
+
+
+def test_javascript_helpers_are_renamed():
+    block = 'const x = require("x");\nfunction helper() {}\ndescribe("a", () => { helper(); });\n'
+    content = assemble_test_file([block, block], "javascript", "x")
+    assert content.count("function helper()") == 1
+    assert "function helper_2() {}\ndescribe(\"a\", () => { helper_2(); });" in content
@@ -0,0 +1,138 @@
+import io
+import json
+import tarfile
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from fastapi.testclient import TestClient
+
+from backend import app as app_module
+
+FILES = {
+    "pkg/a.py": "def add(a, b):\n    return a + b\n",
+    "pkg/b.js": "function hello() {}\nclass Greeter {}\n",
+    "README.md": "# skipped\n",
+}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    # Threads instead of forkserver workers keep the tests fast; the work is the same.
+    executor = ThreadPoolExecutor(max_workers=2)
+    monkeypatch.setattr(app_module, "_get_process_pool", lambda: executor)
+    yield TestClient(app_module.app)
+    executor.shutdown()
+
+
+def post(client, body: bytes, content_type: str) -> list:
+    response = client.post("/generate/batch", content=body, headers={"Content-Type": content_type})
+    assert response.status_code == 200, response.text
+    return [json.loads(line) for line in response.text.splitlines()]
+
+
+def by_path(lines: list) -> dict:
+    return {line["path"]: line for line in lines if "summary" not in line}
+
+
+def tar_gz(files: dict) -> bytes:
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz") as archive:
+        for path, text in files.items():
+            data = text.encode("utf-8")
+            info = tarfile.TarInfo(path)
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+
+def zip_bytes(files: dict, compression=zipfile.ZIP_DEFLATED) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", compression) as archive:
+        for path, text in files.items():
+            archive.writestr(path, text)
+    return buffer.getvalue()
+
+
+def check_results(lines: list):
+    results = by_path(lines)
+    assert set(results) == {"pkg/a.py", "pkg/b.js"}
+    assert results["pkg/a.py"]["ok"] and results["pkg/a.py"]["filename"] == "test_a.py"
+    assert "def test_add" in results["pkg/a.py"]["content"]
+    assert results["pkg/b.js"] == {
+        "path": "pkg/b.js", "language": "javascript", "ok": True,
+        "functions_found": ["hello"], "classes_found": ["Greeter"],
+    }
+    assert lines[-1] == {"summary": {"files": 2, "ok": 2, "failed": 0}}
+
+
+def test_ndjson(client):
+    body = "".join(json.dumps({"path": p, "source": s}) + "\n" for p, s in FILES.items())
+    check_results(post(client, body.encode(), "application/x-ndjson"))
+
+
+def test_invalid_ndjson_lines_are_reported_inline(client):
+    body = json.dumps({"path": "a.py", "source": "x = 1\n"}) + "\nnot json\n" + json.dumps({"path": "b.py"}) + "\n"
+    lines = post(client, body.encode(), "application/x-ndjson")
+    errors = [line["error"] for line in lines if line.get("path") is None and "error" in line]
+    assert len(errors) == 2 and all(e.startswith("Invalid NDJSON line") for e in errors)
+    assert lines[-1]["summary"] == {"files": 3, "ok": 1, "failed": 2}
+
+
+def test_tar_gz(client):
+    check_results(post(client, tar_gz(FILES), "application/gzip"))
+
+
+def test_zip(client):
+    check_results(post(client, zip_bytes(FILES), "application/zip"))
+
+
+def test_corrupt_zip_member_fails_only_that_file(client):
+    files = {"bad.py": "def broken():\n    return 1\n", **FILES}
+    data = bytearray(zip_bytes(files, zipfile.ZIP_STORED))
+    offset = data.index(b"def broken")
+    data[offset:offset + 3] = b"DEF"
+    results = by_path(post(client, bytes(data), "application/zip"))
+    assert results["bad.py"]["ok"] is False
+    assert results["bad.py"]["error"].startswith("Failed to read file:")
+    assert results["pkg/a.py"]["ok"] and results["pkg/b.js"]["ok"]
+
+
+def test_corrupt_deflate_data_fails_only_that_file(client):
+    files = {"bad.py": "x = 1\n" * 200, **FILES}
+    data = bytearray(zip_bytes(files))
+    with zipfile.ZipFile(io.BytesIO(bytes(data))) as archive:
+        info = archive.getinfo("bad.py")
+    start = info.header_offset + 30 + len(info.filename) + len(info.extra)
+    data[start:start + info.compress_size] = b"\xff" * info.compress_size
+    results = by_path(post(client, bytes(data), "application/zip"))
+    assert results["bad.py"]["error"].startswith("Failed to read file:")
+    assert results["pkg/a.py"]["ok"] and results["pkg/b.js"]["ok"]
+
+
+def test_truncated_tar_keeps_earlier_results(client):
+    data = tar_gz({"pkg/a.py": FILES["pkg/a.py"], "big.py": "x = 1\n" * 20_000})
+    lines = post(client, data[:len(data) // 2], "application/gzip")
+    results = by_path(lines)
+    assert results["pkg/a.py"]["ok"]
+    assert results[None]["error"].startswith("Failed to read upload:")
+
+
+def test_oversize_files_are_reported_not_read(client, monkeypatch):
+    monkeypatch.setattr(app_module, "BATCH_MAX_FILE_BYTES", 100)
+    files = {"small.py": "x = 1\n", "large.py": "x = 1\n" * 20}
+    expected = "File is larger than 100 bytes."
+    for body, content_type in (
+        ("".join(json.dumps({"path": p, "source": s}) + "\n" for p, s in files.items()).encode(),
+         "application/x-ndjson"),
+        (tar_gz(files), "application/x-tar"),
+        (zip_bytes(files), "application/zip"),
+    ):
+        results = by_path(post(client, body, content_type))
+        assert results["small.py"]["ok"], content_type
+        assert results["large.py"] == {"path": "large.py", "ok": False, "error": expected}, content_type
+
+
+def test_unknown_content_type_and_invalid_zip_are_rejected(client):
+    assert client.post("/generate/batch", content=b"x", headers={"Content-Type": "text/plain"}).status_code == 415
+    assert client.post("/generate/batch", content=b"x", headers={"Content-Type": "application/zip"}).status_code == 400
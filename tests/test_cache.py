@@ -0,0 +1,119 @@
+import os
+
+import pytest
+
+from backend import cache
+from backend.cache import BlockCache, block_key
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = {"t": 1_000_000.0}
+    monkeypatch.setattr(cache.time, "time", lambda: now["t"])
+    return now
+
+
+def test_block_key_ignores_formatting_but_not_params():
+    assert block_key("def f():\n    return 1\n") == block_key("  def f():  \r\n\n      return 1")
+    assert block_key("def f(): pass", model="a") != block_key("def f(): pass", model="b")
+
+
+def test_memory_hit_without_disk():
+    for path in (None, ""):
+        store = BlockCache(path=path)
+        assert store.get("k") is None
+        store.put("k", "v")
+        assert store.get("k") == "v"
+        assert store._db is None
+
+
+def test_memory_tier_is_lru_bounded():
+    store = BlockCache(memory_entries=2, path=None)
+    store.put("a", "1")
+    store.put("b", "2")
+    store.get("a")
+    store.put("c", "3")
+    assert [store.get(k) for k in "abc"] == ["1", None, "3"]
+
+
+def test_disk_hit_survives_a_new_instance(tmp_path):
+    path = str(tmp_path / "blocks.sqlite3")
+    BlockCache(path=path).put("k", "v")
+    fresh = BlockCache(path=path)
+    assert fresh._memory == {}
+    assert fresh.get("k") == "v"
+    assert "k" in fresh._memory
+
+
+def test_nothing_is_opened_until_first_use(tmp_path):
+    path = str(tmp_path / "sub" / "blocks.sqlite3")
+    store = BlockCache(path=path)
+    assert not os.path.exists(path)
+    store.get("k")
+    assert os.path.exists(path)
+
+
+def test_memory_entries_expire_after_max_age(clock):
+    store = BlockCache(path=None, max_age=60)
+    store.put("k", "v")
+    clock["t"] += 59
+    assert store.get("k") == "v"
+    clock["t"] += 2
+    assert store.get("k") is None
+    assert "k" not in store._memory
+
+
+def test_disk_entries_expire_after_max_age(tmp_path, clock):
+    path = str(tmp_path / "blocks.sqlite3")
+    BlockCache(path=path, max_age=60).put("k", "v")
+    clock["t"] += 61
+    store = BlockCache(path=path, max_age=60)
+    assert store.get("k") is None
+
+
+def test_disk_hit_keeps_original_creation_time(tmp_path, clock):
+    path = str(tmp_path / "blocks.sqlite3")
+    BlockCache(path=path, max_age=60).put("k", "v")
+    clock["t"] += 50
+    store = BlockCache(path=path, max_age=60)
+    assert store.get("k") == "v"
+    clock["t"] += 11
+    assert store.get("k") is None
+
+
+def test_prune_drops_least_recently_used_over_max_bytes(tmp_path, clock):
+    store = BlockCache(path=str(tmp_path / "blocks.sqlite3"), max_bytes=25)
+    for key in "abcde":
+        clock["t"] += 1
+        store.put(key, "x" * 10)
+    clock["t"] += 1
+    store._memory.clear()
+    store.get("a")
+    store.prune()
+    store._memory.clear()
+    assert [key for key in "abcde" if store.get(key) is not None] == ["a", "e"]
+
+
+def test_prune_drops_expired_rows(tmp_path, clock):
+    store = BlockCache(path=str(tmp_path / "blocks.sqlite3"), max_age=60)
+    store.put("old", "v")
+    clock["t"] += 61
+    store.put("new", "v")
+    store.prune()
+    rows = store._db.execute("SELECT key FROM blocks").fetchall()
+    assert rows == [("new",)]
+
+
+def test_maybe_prune_waits_for_enough_puts(tmp_path, clock, monkeypatch):
+    monkeypatch.setattr(cache, "PRUNE_EVERY", 3)
+    store = BlockCache(path=str(tmp_path / "blocks.sqlite3"), max_bytes=10)
+    for key in "ab":
+        clock["t"] += 1
+        store.put(key, "x" * 10)
+    store.maybe_prune()
+    assert store._db.execute("SELECT COUNT(*) FROM blocks").fetchone()[0] == 2
+    clock["t"] += 1
+    store.put("c", "x" * 10)
+    store.maybe_prune()
+    assert store._db.execute("SELECT key FROM blocks").fetchall() == [("c",)]
+    assert store._puts == 0
@@ -0,0 +1,80 @@
+import pytest
+
+from backend.app import FenceStripper, _strip_fences
+
+
+def stream(text: str, chunks) -> str:
+    """Feed ``text`` to a FenceStripper split at the given offsets."""
+    stripper = FenceStripper()
+    out = []
+    start = 0
+    for end in list(chunks) + [len(text)]:
+        out.append(stripper.feed(text[start:end]))
+        start = end
+    out.append(stripper.flush())
+    return "".join(out)
+
+
+def every_split(text: str):
+    """Whole text, every single split point, and one character per chunk."""
+    yield []
+    for i in range(1, len(text)):
+        yield [i]
+    yield range(1, len(text))
+
+
+CASES = [
+    ("```python\ndef test_a():\n    assert a() == 1\n```\n", "def test_a():\n    assert a() == 1"),
+    ("```java\n@Test\nvoid a() {}\n```", "@Test\nvoid a() {}"),
+    ("```javascript\nit('a', () => {});\n```", "it('a', () => {});"),
+    ("  \n```\nx = 1\n```  \n\n", "x = 1"),
+    ("import a\n```python\ntest_b = 1\n```\n```python\ntest_c = 2\n```", "import a\n\ntest_b = 1\n\n\ntest_c = 2"),
+    ("no fences at all", "no fences at all"),
+    ("a `tick` and ``two``", "a `tick` and ``two``"),
+    ("x = 1 ``", "x = 1 ``"),
+    ("```py", "py"),
+    ("```jav", "jav"),
+    ("```", ""),
+]
+
+
+@pytest.mark.parametrize("text, expected", CASES)
+def test_matches_strip_fences_for_ordinary_fences(text, expected):
+    assert _strip_fences(text) == expected
+    for chunks in every_split(text):
+        assert stream(text, chunks) == expected, list(chunks)
+
+
+def test_tag_split_across_chunks_is_not_emitted():
+    # "```java" is a complete tag, but "script" may still follow.
+    stripper = FenceStripper()
+    assert stripper.feed("```java") == ""
+    assert stripper.feed("script\nit()") == "it()"
+    assert stripper.flush() == ""
+
+
+def test_fence_split_across_chunks_is_held_back():
+    stripper = FenceStripper()
+    assert stripper.feed("x = 1\n`") == "x = 1"
+    assert stripper.feed("`") == ""
+    assert stripper.feed("`python\ny = 2") == "\n\ny = 2"
+    assert stripper.flush() == ""
+
+
+def test_trailing_whitespace_is_held_until_more_text():
+    stripper = FenceStripper()
+    assert stripper.feed("a  \n") == "a"
+    assert stripper.feed("b\n") == "  \nb"
+    assert stripper.flush() == ""
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("jav````javascript ", "jav`javascript"),
+    ("a````java", "a`java"),
+    ("````python", "`python"),
+])
+def test_removes_fences_left_to_right(text, expected):
+    # _strip_fences replaces one pattern at a time and differs here.
+    assert _strip_fences(text) != expected
+    for chunks in every_split(text):
+        assert stream(text, chunks) == expected, list(chunks)
@@ -0,0 +1,278 @@
+import asyncio
+import json
+import sqlite3
+import time
+
+import pytest
+
+from backend import jobs
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def until(predicate, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out"
+        await asyncio.sleep(0.01)
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "jobs.sqlite3")
+
+
+def queue(path, **kwargs) -> jobs.JobQueue:
+    kwargs.setdefault("workers", 2)
+    return jobs.JobQueue(path=path, **kwargs)
+
+
+def status(q: jobs.JobQueue, job_id: str):
+    return q.get(job_id)["status"]
+
+
+def test_submit_runs_the_job_and_keeps_secrets_out_of_the_store(path):
+    async def scenario():
+        q = queue(path)
+        seen = []
+
+        async def double(payload):
+            seen.append(payload)
+            return {"value": payload["n"] * 2}
+
+        q.register("double", double)
+        await q.start()
+        job = await q.submit("double", {"n": 21}, priority="interactive", secrets={"api_key": "k"})
+        assert job["status"] in ("queued", "running") and job["priority"] == "interactive"
+        await until(lambda: status(q, job["id"]) == "succeeded")
+        await q.stop()
+        return q, job["id"], seen
+
+    q, job_id, seen = run(scenario())
+    assert q.get(job_id, with_result=True)["result"] == {"value": 42}
+    assert seen == [{"n": 21, "api_key": "k"}]
+    stored = sqlite3.connect(path).execute("SELECT payload FROM jobs WHERE id = ?", (job_id,)).fetchone()[0]
+    assert json.loads(stored) == {"n": 21}
+    assert (q.queued, q._secrets, q._pushed) == (0, {}, {})
+
+
+def test_unknown_kind_and_full_queue_are_rejected(path):
+    async def scenario():
+        q = queue(path, workers=0, max_queued=2)
+
+        async def noop(payload):
+            return {}
+
+        q.register("noop", noop)
+        await q.start()
+        with pytest.raises(ValueError):
+            await q.submit("missing", {})
+        await q.submit("noop", {}, priority="bulk")
+        # Bulk jobs may only use 90% of the queue; interactive ones the rest.
+        with pytest.raises(jobs.QueueFullError):
+            await q.submit("noop", {}, priority="bulk")
+        await q.submit("noop", {}, priority="interactive")
+        with pytest.raises(jobs.QueueFullError):
+            await q.submit("noop", {}, priority="interactive")
+        await q.stop()
+
+    run(scenario())
+
+
+def test_cancel_queued_and_running_jobs(path):
+    async def scenario():
+        q = queue(path, workers=1)
+        release = asyncio.Event()
+        ran = []
+
+        async def blocking(payload):
+            ran.append(payload["n"])
+            await release.wait()
+            return {}
+
+        q.register("blocking", blocking)
+        await q.start()
+        first = await q.submit("blocking", {"n": 1})
+        second = await q.submit("blocking", {"n": 2}, secrets={"api_key": "k"})
+        await until(lambda: ran == [1])
+        assert q.queued == 1
+        assert q.cancel(second["id"])["status"] == "cancelled"
+        assert q.queued == 0 and second["id"] not in q._secrets
+        assert q.cancel(first["id"])["status"] in ("running", "cancelled")
+        await until(lambda: status(q, first["id"]) == "cancelled")
+        assert q.get(first["id"])["error"] == "Job was cancelled."
+        # Cancelling a finished job changes nothing.
+        assert q.cancel(first["id"])["status"] == "cancelled"
+        release.set()
+        third = await q.submit("blocking", {"n": 3})
+        await until(lambda: status(q, third["id"]) == "succeeded")
+        await q.stop()
+        return q, ran
+
+    q, ran = run(scenario())
+    assert ran == [1, 3]
+    assert (q.queued, q._cancelled, q._pushed, q.in_flight) == (0, set(), {}, 0)
+
+
+def test_two_queues_on_one_store_run_each_job_once(path):
+    async def scenario():
+        producer = queue(path, workers=0)
+        ran = []
+
+        async def record(payload):
+            ran.append(payload["n"])
+            await asyncio.sleep(0.01)
+            return {}
+
+        producer.register("record", record)
+        await producer.start()
+        submitted = [(await producer.submit("record", {"n": n}))["id"] for n in range(10)]
+        # Both consumers load every queued row, but each job is claimed once.
+        consumers = [queue(path), queue(path)]
+        for q in consumers:
+            q.register("record", record)
+            await q.start()
+        await until(lambda: all(status(producer, job_id) == "succeeded" for job_id in submitted))
+        for q in consumers:
+            await until(lambda: q.queued == 0)
+            await q.stop()
+        await producer.stop()
+        return ran, consumers
+
+    ran, consumers = run(scenario())
+    assert sorted(ran) == list(range(10))
+    for q in consumers:
+        assert (q._queued, q._pushed, q._cancelled) == ({0: 0, 1: 0}, {}, set())
+
+
+def test_cancelling_another_queues_jobs_leaves_both_counters_consistent(path):
+    async def scenario():
+        owner = queue(path, workers=1)
+        other = queue(path, workers=1)
+        release = asyncio.Event()
+        ran = []
+
+        async def blocking(payload):
+            ran.append(payload["n"])
+            await release.wait()
+            return {}
+
+        for q in (owner, other):
+            q.register("blocking", blocking)
+            await q.start()
+        ids = [(await owner.submit("blocking", {"n": n}))["id"] for n in range(4)]
+        await until(lambda: ran == [0])
+        for job_id in ids[1:]:
+            assert other.cancel(job_id)["status"] == "cancelled"
+        assert (other.queued, other._cancelled) == (0, set())
+        assert owner.queued == 3
+        release.set()
+        await until(lambda: owner.queued == 0 and owner.in_flight == 0)
+        for q in (owner, other):
+            await q.stop()
+        return owner, other, ids, ran
+
+    owner, other, ids, ran = run(scenario())
+    assert ran == [0]
+    assert [status(owner, job_id) for job_id in ids] == ["succeeded"] + ["cancelled"] * 3
+    for q in (owner, other):
+        assert (q._queued, q._pushed, q._cancelled) == ({0: 0, 1: 0}, {}, set())
+
+
+def test_expired_lease_is_recovered_by_another_queue(path):
+    async def scenario():
+        stalled = queue(path, workers=1, lease=0.3)
+        rescuer = queue(path, workers=1, lease=0.3)
+        calls = []
+
+        async def stall(payload):
+            calls.append("stalled")
+            await asyncio.Event().wait()
+
+        async def finish(payload):
+            calls.append("rescuer")
+            return {"by": "rescuer"}
+
+        stalled.register("job", stall)
+        rescuer.register("job", finish)
+        await stalled.start()
+        await rescuer.start()
+        job = await stalled.submit("job", {})
+        await until(lambda: calls == ["stalled"])
+        # The stalled process stops renewing its lease, as if it had died.
+        stalled._tasks[-1].cancel()
+        await until(lambda: status(rescuer, job["id"]) == "succeeded")
+        await stalled.stop()
+        await rescuer.stop()
+        return rescuer, job["id"], calls
+
+    rescuer, job_id, calls = run(scenario())
+    job = rescuer.get(job_id, with_result=True)
+    assert calls == ["stalled", "rescuer"]
+    assert job["result"] == {"by": "rescuer"} and job["attempts"] == 2
+
+
+def test_retry_later_requeues_until_the_handler_succeeds(path):
+    async def scenario():
+        q = queue(path, max_attempts=5)
+        attempts = []
+
+        async def flaky(payload):
+            attempts.append(1)
+            if len(attempts) < 3:
+                raise jobs.RetryLater(delay=0.01)
+            return {"ok": True}
+
+        q.register("flaky", flaky)
+        await q.start()
+        job = await q.submit("flaky", {})
+        await until(lambda: status(q, job["id"]) == "succeeded")
+        await q.stop()
+        return q.get(job["id"])
+
+    assert run(scenario())["attempts"] == 3
+
+
+def test_retry_later_gives_up_after_max_attempts(path):
+    async def scenario():
+        q = queue(path, max_attempts=3)
+
+        async def busy(payload):
+            raise jobs.RetryLater(delay=0.01, message="Upstream busy.", status_code=503)
+
+        q.register("busy", busy)
+        await q.start()
+        job = await q.submit("busy", {})
+        await until(lambda: status(q, job["id"]) == "failed")
+        await q.stop()
+        return q, q.get(job["id"])
+
+    q, job = run(scenario())
+    assert job["attempts"] == 3 and job["error_status"] == 503
+    assert job["error"] == "Gave up after 3 attempts: Upstream busy."
+    assert (q.queued, q._delayed) == (0, set())
+
+
+def test_cancel_during_retry_delay_drops_the_job(path):
+    async def scenario():
+        q = queue(path)
+        attempts = []
+
+        async def busy(payload):
+            attempts.append(1)
+            raise jobs.RetryLater(delay=0.2)
+
+        q.register("busy", busy)
+        await q.start()
+        job = await q.submit("busy", {})
+        await until(lambda: job["id"] in q._delayed)
+        assert q.cancel(job["id"])["status"] == "cancelled"
+        await asyncio.sleep(0.3)
+        await q.stop()
+        return q, attempts
+
+    q, attempts = run(scenario())
+    assert attempts == [1]
+    assert (q.queued, q._delayed, q._cancelled, q._pushed) == (0, set(), set(), {})
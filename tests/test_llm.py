@@ -0,0 +1,176 @@
+import asyncio
+
+import openai
+import pytest
+
+from backend import llm
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    """Replace the upstream call with one that waits for ``release`` and counts calls."""
+    state = {"count": 0, "release": None}
+
+    async def fake_call(api_key, base_url, params):
+        state["count"] += 1
+        await state["release"].wait()
+        return f"reply to {params['messages'][-1]['content']}"
+
+    monkeypatch.setattr(llm, "_call", fake_call)
+    return state
+
+
+def test_identical_requests_share_one_call(calls):
+    async def scenario():
+        calls["release"] = asyncio.Event()
+        messages = [{"role": "user", "content": "same"}]
+        waiters = [asyncio.ensure_future(llm.complete(messages, api_key="k")) for _ in range(5)]
+        await asyncio.sleep(0)
+        calls["release"].set()
+        return await asyncio.gather(*waiters)
+
+    assert run(scenario()) == ["reply to same"] * 5
+    assert calls["count"] == 1
+    assert llm._inflight == {}
+
+
+def test_different_requests_are_not_coalesced(calls):
+    async def scenario():
+        calls["release"] = asyncio.Event()
+        waiters = [
+            asyncio.ensure_future(llm.complete([{"role": "user", "content": text}], api_key=key))
+            for text, key in (("a", "k"), ("b", "k"), ("a", "other"))
+        ]
+        await asyncio.sleep(0)
+        calls["release"].set()
+        return await asyncio.gather(*waiters)
+
+    assert run(scenario()) == ["reply to a", "reply to b", "reply to a"]
+    assert calls["count"] == 3
+
+
+def test_cancelled_caller_does_not_cancel_shared_call(calls):
+    async def scenario():
+        calls["release"] = asyncio.Event()
+        messages = [{"role": "user", "content": "x"}]
+        first = asyncio.ensure_future(llm.complete(messages, api_key="k"))
+        second = asyncio.ensure_future(llm.complete(messages, api_key="k"))
+        await asyncio.sleep(0)
+        first.cancel()
+        calls["release"].set()
+        return await second
+
+    assert run(scenario()) == "reply to x"
+    assert calls["count"] == 1
+
+
+def test_limiter_rejects_when_wait_queue_is_full():
+    async def scenario():
+        limiter = llm.ConcurrencyLimiter(limit=1, max_waiting=1, wait_timeout=5)
+        release = asyncio.Event()
+
+        async def hold():
+            async with limiter.slot():
+                await release.wait()
+
+        holder = asyncio.ensure_future(hold())
+        waiter = asyncio.ensure_future(hold())
+        await asyncio.sleep(0)
+        assert (limiter.in_flight, limiter.waiting) == (1, 1)
+        with pytest.raises(llm.LLMBusyError) as busy:
+            async with limiter.slot():
+                pass
+        release.set()
+        await asyncio.gather(holder, waiter)
+        return busy.value, limiter
+
+    busy, limiter = run(scenario())
+    assert busy.retry_after >= 1
+    assert (limiter.in_flight, limiter.waiting) == (0, 0)
+
+
+def test_limiter_times_out_waiting_for_a_slot():
+    async def scenario():
+        limiter = llm.ConcurrencyLimiter(limit=1, max_waiting=10, wait_timeout=0.05)
+        async with limiter.slot():
+            with pytest.raises(llm.LLMBusyError, match="Timed out"):
+                async with limiter.slot():
+                    pass
+        return limiter
+
+    limiter = run(scenario())
+    assert (limiter.in_flight, limiter.waiting) == (0, 0)
+
+
+def test_busy_limiter_surfaces_through_complete(monkeypatch):
+    async def scenario():
+        monkeypatch.setattr(llm, "limiter", llm.ConcurrencyLimiter(limit=1, max_waiting=0, wait_timeout=5))
+        release = asyncio.Event()
+
+        async def hold():
+            async with llm.limiter.slot():
+                await release.wait()
+
+        holder = asyncio.ensure_future(hold())
+        await asyncio.sleep(0)
+        try:
+            with pytest.raises(llm.LLMBusyError):
+                await llm.complete([{"role": "user", "content": "x"}], api_key="k")
+        finally:
+            release.set()
+            await holder
+
+    run(scenario())
+    assert llm._inflight == {}
+
+
+class FakeClient:
+    instances = []
+
+    def __init__(self, api_key, base_url, timeout):
+        self.api_key = api_key
+        self.closed = False
+        FakeClient.instances.append(self)
+
+    async def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def fake_clients(monkeypatch):
+    FakeClient.instances = []
+    monkeypatch.setattr(openai, "AsyncOpenAI", FakeClient)
+    monkeypatch.setattr(llm, "MAX_CLIENTS", 2)
+    monkeypatch.setattr(llm, "_clients", type(llm._clients)())
+    monkeypatch.setattr(llm, "_users", {})
+    monkeypatch.setattr(llm, "_evicted", {})
+    return FakeClient.instances
+
+
+def test_evicted_idle_client_is_closed(fake_clients):
+    async def scenario():
+        for key in ("a", "b", "c"):
+            llm.get_client(key)
+        await asyncio.sleep(0)
+
+    run(scenario())
+    assert [(c.api_key, c.closed) for c in fake_clients] == [("a", True), ("b", False), ("c", False)]
+
+
+def test_evicted_client_stays_open_until_its_call_finishes(fake_clients):
+    async def scenario():
+        async with llm._client("a", None) as client:
+            llm.get_client("b")
+            llm.get_client("c")
+            await asyncio.sleep(0)
+            assert not client.closed
+            assert client not in llm._clients.values()
+        await asyncio.sleep(0)
+        assert client.closed
+        assert llm._evicted == {}
+
+    run(scenario())
@@ -0,0 +1,115 @@
+import random
+
+import pytest
+from fastapi.testclient import TestClient
+
+from backend.app import ContentChange, ParseSession, app, extract_symbols_ai
+
+SOURCES = {
+    "python": "import os\n\n\ndef a(x):\n    return 'é' + x\n\n\nclass B:\n    def m(self):\n        return '😀'\n",
+    "javascript": "const s = 'ü';\n\nfunction a(x) {\n  return x + '😀';\n}\n\nclass B {\n  m() { return 1; }\n}\n",
+    "java": "class B {\n    String s = \"é\";\n\n    int m() {\n        return 1;\n    }\n}\n",
+}
+SNIPPETS = {
+    "python": ["\ndef f{n}(y):\n    return 'ß{n}'\n", "\nclass K{n}:\n    def g{n}(self): pass\n", "😀", "é", "\n", "x", ""],
+    "javascript": ["\nfunction f{n}(y) {{ return '😀'; }}\n", "\nclass K{n} {{ g{n}() {{}} }}\n", "é", "\n", "}}", ""],
+    "java": ["\n    void f{n}() {{ }}\n", "\n    class K{n} {{ }}\n", "é", "😀", "\n", "{{", ""],
+}
+
+
+def offset(text: str, line: int, character: int) -> int:
+    """Reference LSP position -> string index, clamping like editors do."""
+    lines = text.split("\n")
+    if line >= len(lines):
+        return len(text)
+    index = sum(len(l) + 1 for l in lines[:line])
+    units = 0
+    for ch in lines[line]:
+        width = 2 if ord(ch) > 0xFFFF else 1
+        if units + width > character:
+            break
+        units += width
+        index += 1
+    return index
+
+
+def random_position(rng: random.Random, text: str) -> dict:
+    lines = text.split("\n")
+    line = rng.randrange(len(lines) + 1)
+    length = len(lines[line].encode("utf-16-le")) // 2 if line < len(lines) else 0
+    return {"line": line, "character": rng.randrange(length + 3)}
+
+
+def random_change(rng: random.Random, text: str, n: int, language: str) -> dict:
+    start, end = random_position(rng, text), random_position(rng, text)
+    if offset(text, start["line"], start["character"]) > offset(text, end["line"], end["character"]):
+        start, end = end, start
+    return {"range": {"start": start, "end": end}, "text": rng.choice(SNIPPETS[language]).format(n=n)}
+
+
+def apply_reference(text: str, change: dict) -> str:
+    r = change["range"]
+    start = offset(text, r["start"]["line"], r["start"]["character"])
+    end = offset(text, r["end"]["line"], r["end"]["character"])
+    return text[:start] + change["text"] + text[end:]
+
+
+def names(symbols) -> list:
+    return [(s["type"], s["name"]) for s in symbols]
+
+
+@pytest.mark.parametrize("language", sorted(SOURCES))
+@pytest.mark.parametrize("seed", range(20))
+def test_incremental_edits_match_a_full_parse(language, seed):
+    rng = random.Random(seed)
+    text = SOURCES[language]
+    session = ParseSession(language, text, 0)
+    session.symbols()
+    for step in range(15):
+        changes = []
+        for i in range(rng.randint(1, 3)):
+            change = random_change(rng, text, step * 10 + i, language)
+            text = apply_reference(text, change)
+            changes.append(ContentChange(**change))
+        session.apply(changes)
+        assert session.source.decode("utf-8") == text
+        assert names(session.symbols()) == names(extract_symbols_ai(text, language)), (seed, step)
+
+
+def test_full_replacement_resets_the_session():
+    session = ParseSession("python", SOURCES["python"], 0)
+    session.symbols()
+    session.apply([ContentChange(text="def only():\n    pass\n")])
+    assert names(session.symbols()) == [("function", "only")]
+
+
+@pytest.mark.parametrize("bad", [
+    {"start": {"line": 3, "character": 0}, "end": {"line": 1, "character": 0}},
+    {"start": {"line": 0, "character": 5}, "end": {"line": 0, "character": 2}},
+    {"start": {"line": -1, "character": 0}, "end": {"line": 0, "character": 0}},
+    {"start": {"line": 0, "character": -3}, "end": {"line": 0, "character": 0}},
+])
+def test_invalid_ranges_are_rejected_without_changing_the_session(bad):
+    session = ParseSession("python", SOURCES["python"], 0)
+    before = names(session.symbols())
+    good = {"range": {"start": {"line": 0, "character": 0}, "end": {"line": 0, "character": 0}}, "text": "# c\n"}
+    with pytest.raises(ValueError):
+        session.apply([ContentChange(**good), ContentChange(range=bad, text="x")])
+    assert session.source.decode("utf-8") == SOURCES["python"]
+    assert names(session.symbols()) == before
+    # The session still accepts valid edits afterwards.
+    everything = {"start": {"line": 0, "character": 0}, "end": {"line": 99, "character": 99}}
+    session.apply([ContentChange(range=everything, text="x")])
+    assert session.source == b"x"
+    assert session.symbols() == []
+
+
+def test_edit_endpoint_answers_400_for_a_reversed_range():
+    client = TestClient(app)
+    created = client.post("/sessions", json={"source": SOURCES["python"], "language": "python"}).json()
+    url = f"/sessions/{created['session_id']}/edits"
+    reversed_range = {"start": {"line": 4, "character": 0}, "end": {"line": 0, "character": 0}}
+    response = client.post(url, json={"changes": [{"range": reversed_range, "text": "x"}]})
+    assert response.status_code == 400
+    response = client.post(url, json={"changes": []})
+    assert response.json()["functions_found"] == created["functions_found"]
@@ -0,0 +1,152 @@
+import pytest
+
+from backend.app import AI_LANGUAGES, _split_batch, parse_source_ai
+from backend.slicing import ModuleSlicer, estimate_tokens, pack_batches
+
+MODULE = '''import os
+import sys
+
+LIMIT = 10
+
+
+def helper(x):
+    return x + LIMIT
+
+
+def big_helper(x):
+    total = 0
+''' + "".join(f"    total += x * {i}\n" for i in range(40)) + '''    return total
+
+
+def uses_helper(y):
+    return helper(y) + big_helper(y) + len(os.sep)
+
+
+class Box:
+    size = LIMIT
+
+    def __init__(self, value):
+        self.value = value
+
+    def get(self):
+        return self.value
+
+    def doubled(self):
+        return self.get() * 2
+'''
+
+
+def slicer(source: str = MODULE, language_id: str = "python") -> ModuleSlicer:
+    tree = parse_source_ai(source, language_id)
+    return ModuleSlicer(tree, language_id, AI_LANGUAGES[language_id]["language"])
+
+
+def unit(name: str, source_tokens: int, context=(), imports=()) -> dict:
+    return {"type": "function", "name": name, "source": f"{name} " + "x" * 4 * (source_tokens - 1),
+            "context": list(context), "imports": list(imports)}
+
+
+# ── pack_batches ──
+
+def test_everything_that_fits_goes_in_one_batch_regardless_of_max_symbols():
+    units = [unit(f"f{i}", 10, context=["shared context piece"]) for i in range(20)]
+    assert pack_batches(units, budget=10_000, max_symbols=3) == [list(range(20))]
+
+
+def test_no_units_means_no_batches():
+    assert pack_batches([], budget=100) == []
+
+
+def test_split_by_max_symbols_when_over_budget():
+    units = [unit(f"f{i}", 10) for i in range(7)]
+    assert pack_batches(units, budget=65, max_symbols=3) == [[0, 1, 2], [3, 4, 5], [6]]
+
+
+def test_split_by_budget_counts_shared_context_once_per_batch():
+    context = "c " * 19 + "c"
+    assert estimate_tokens(context) == 20
+    units = [unit(f"f{i}", 10, context=[context]) for i in range(5)]
+    # 20 of context plus three 10-token sources fill a 50-token batch.
+    assert pack_batches(units, budget=50, max_symbols=10) == [[0, 1, 2], [3, 4]]
+
+
+def test_oversized_unit_still_gets_a_batch_of_its_own():
+    units = [unit("small", 5), unit("huge", 500), unit("tail", 5)]
+    assert pack_batches(units, budget=100, max_symbols=10) == [[0], [1], [2]]
+
+
+# ── ModuleSlicer ──
+
+def test_units_carry_only_referenced_imports_and_definitions():
+    units = {u["name"]: u for u in slicer().slice()}
+    assert set(units) == {"helper", "big_helper", "uses_helper", "Box"}
+    assert units["helper"]["imports"] == []
+    assert units["helper"]["context"] == ["LIMIT = 10"]
+    assert units["uses_helper"]["imports"] == ["import os"]
+    assert units["uses_helper"]["context"][0].startswith("def helper(x):")
+
+
+def test_context_falls_back_to_signatures_over_budget():
+    s = slicer()
+    refs = s.refs(s.definitions["uses_helper"]["node"])
+    full = s._context(refs, {"uses_helper"}, budget=10_000)
+    assert full[1].startswith("def big_helper(x):") and "total +=" in full[1]
+    budget = estimate_tokens(full[0]) + estimate_tokens("def big_helper(x): ...")
+    small = s._context(refs, {"uses_helper"}, budget=budget)
+    assert small == [full[0], "def big_helper(x): ..."]
+    assert s._context(refs, {"uses_helper"}, budget=0) == []
+
+
+def test_context_excludes_given_names():
+    s = slicer()
+    refs = s.refs(s.definitions["uses_helper"]["node"])
+    assert not any(p.startswith("def helper") for p in s._context(refs, {"helper"}, budget=10_000))
+
+
+def test_large_class_is_split_into_method_units_sharing_a_frame():
+    units = slicer().slice(unit_token_limit=10)
+    methods = {u["name"]: u for u in units if u["name"].startswith("Box.")}
+    assert set(methods) == {"Box.__init__", "Box.get", "Box.doubled"}
+    assert methods["Box.get"]["source"] == "def get(self):\n    return self.value"
+    frame = methods["Box.get"]["context"][-1]
+    assert frame == methods["Box.__init__"]["context"][-1]
+    assert "def __init__" in frame and "size = LIMIT" in frame
+    assert "def get" not in frame and "def doubled" not in frame
+    # Sibling methods a method calls come after the frame.
+    doubled = methods["Box.doubled"]["context"]
+    assert doubled[doubled.index(frame) + 1:] == [methods["Box.get"]["source"]]
+
+
+def test_javascript_method_units_use_braced_signatures():
+    source = "function helper(a) {\n" + "  a += 1;\n" * 30 + "  return a;\n}\n\n" \
+             "class Box {\n  constructor(v) { this.v = v; }\n  get() { return helper(this.v); }\n}\n"
+    s = slicer(source, "javascript")
+    units = {u["name"]: u for u in s.slice(unit_token_limit=5, context_budget=20)}
+    assert "function helper(a) { ... }" in units["Box.get"]["context"]
+
+
+# ── _split_batch ──
+
+def test_split_batch_keys_sections_by_marker_and_prepends_preamble():
+    content = "import pytest\n\n# testgenie: b\ndef test_b(): pass\n# testgenie: a\ndef test_a(): pass\n"
+    assert _split_batch(content, ["a", "b"], "#") == [
+        "import pytest\n\ndef test_a(): pass",
+        "import pytest\n\ndef test_b(): pass",
+    ]
+
+
+def test_split_batch_merges_repeated_markers():
+    content = "// testgenie: a\none\n// testgenie: b\ntwo\n  // testgenie: a\nthree"
+    assert _split_batch(content, ["a", "b"], "//") == ["one\n\nthree", "two"]
+
+
+@pytest.mark.parametrize("content", [
+    "def test_a(): pass\ndef test_b(): pass",
+    "# testgenie: a\ndef test_a(): pass",
+])
+def test_split_batch_without_every_marker_is_none(content):
+    assert _split_batch(content, ["a", "b"], "#") is None
+
+
+def test_single_symbol_batch_needs_no_marker():
+    assert _split_batch("def test_a(): pass", ["a"], "#") == ["def test_a(): pass"]